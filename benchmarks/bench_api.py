@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Drives the real FastAPI app in-process through httpx's ASGI transport, with
+# SQLite files (via aiosqlite) standing in for both PostgreSQL databases:
+#
+#   python benchmarks/bench_api.py                      run and compare with baseline.json
+#   python benchmarks/bench_api.py --save-baseline      run and store the result as the baseline
+#   python benchmarks/bench_api.py --only get,list_deep
+#
+# The committed baseline.json was recorded on one machine at the default scale;
+# timings only compare on similar hardware, so save a fresh baseline before
+# comparing anywhere else
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+
+# Settings are required at import time; real values from .env still win
+for name, value in {
+    "MAIN_DB_URL": "unused",
+    "FILE_DB_URL": "unused",
+    "SECRET_KEY": "benchmark-secret",
+    "REFRESH_SECRET_KEY": "benchmark-refresh-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "REFRESH_TOKEN_EXPIRE_MINUTES": "600",
+    # The throwaway databases start empty, and every request comes from one client
+    "MIGRATE_ON_STARTUP": "true",
+    "RATE_LIMIT_ENABLED": "false",
+}.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+from sqlalchemy import event, types
+from sqlalchemy.ext.asyncio import create_async_engine
+import db.db as database
+
+INSTRUMENT_NAME = "Acoustic Guitar (nylon)"
+NOTE_NAMES = ["E2", "A2", "D3", "G3", "B3", "E4", "F#4", "C#5"]
+
+class CoercingUuid(types.Uuid):
+    # Route handlers pass ids from the URL through as strings; psycopg accepts that
+    # for UUID columns, SQLite's processor wants uuid.UUID, so coerce on the way in
+    def bind_processor(self, dialect):
+        process = super().bind_processor(dialect)
+        if process is None:
+            return None
+        return lambda value: process(uuid.UUID(value) if isinstance(value, str) else value)
+
+def use_sqlite(directory: Path):
+    def create(name: str):
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{directory / name}.db",
+            poolclass=database._timed_pool(name),
+            connect_args={"timeout": 30},
+        )
+        # Only these engines' dialect maps UUID columns to the coercing type
+        engine.dialect.colspecs = {**engine.dialect.colspecs, types.Uuid: CoercingUuid}
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_wal(connection, _):
+            connection.execute("PRAGMA journal_mode=WAL")
+
+        database._instrument(engine, name)
+        return engine
+
+    database.main_engine = create("main")
+    database.file_db_engine = create("file")
+    database.SessionLocal.configure(bind=database.main_engine)
+    database.FileSessionLocal.configure(bind=database.file_db_engine)
+
+def song(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        {"note": rng.choice(NOTE_NAMES), "time": index * 0.25, "duration": rng.choice([0.25, 0.5, 1.0]), "velocity": 0.8}
+        for index in range(count)
+    ]
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+async def run_load(name: str, request, total: int, concurrency: int) -> dict:
+    # `request(index)` performs one operation and returns its final HTTP status
+    latencies = []
+    errors = 0
+    indexes = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (index := next(indexes)) < total:
+            started = time.perf_counter()
+            status = await request(index)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": total / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        # Process-wide high-water mark, so it only grows from scenario to scenario
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+class Client:
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def register(self, email: str) -> str:
+        response = await self.client.post("/auth/register", json={"email": email, "username": "bench", "password": "benchmark"})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    async def seed_files(self, token: str, count: int, notes: int = 16):
+        headers = {"Authorization": f"Bearer {token}"}
+        for offset in range(0, count, 50):
+            batch = [
+                {"name": f"seed-{offset + index}", "instrument_name": INSTRUMENT_NAME, "notes": song(notes, offset + index)}
+                for index in range(min(50, count - offset))
+            ]
+            response = await self.client.post("/midi/generate-batch", json=batch, headers=headers)
+            response.raise_for_status()
+
+    async def user_id(self, token: str) -> str:
+        response = await self.client.get("/auth/user", headers={"Authorization": f"Bearer {token}"})
+        return response.json()["id"]
+
+async def scenario_register(client: Client, scale: float):
+    async def request(index):
+        response = await client.client.post(
+            "/auth/register", json={"email": f"register-{index}@example.com", "username": "bench", "password": "benchmark"}
+        )
+        return response.status_code
+    return request, max(int(20 * scale), 1), 4
+
+async def scenario_login(client: Client, scale: float):
+    await client.register("login@example.com")
+
+    async def request(index):
+        response = await client.client.post("/auth/login", json={"email": "login@example.com", "password": "benchmark"})
+        return response.status_code
+    return request, max(int(20 * scale), 1), 4
+
+def _generate(notes: int, total: int, concurrency: int):
+    async def setup(client: Client, scale: float):
+        headers = {"Authorization": f"Bearer {await client.register(f'generate-{notes}@example.com')}"}
+        payloads = [{"name": f"g{index}", "instrument_name": INSTRUMENT_NAME, "notes": song(notes, index)} for index in range(8)]
+
+        async def request(index):
+            response = await client.client.post("/midi/generate", json=payloads[index % len(payloads)], headers=headers)
+            return response.status_code
+        return request, max(int(total * scale), 1), concurrency
+    return setup
+
+async def scenario_get(client: Client, scale: float):
+    token = await client.register("get@example.com")
+    await client.seed_files(token, 50, notes=200)
+    listing = (await client.client.get("/midi/list", params={"limit": 50})).json()["midi_files"]
+    ids = [item["id"] for item in listing]
+
+    async def request(index):
+        response = await client.client.get("/midi/get", params={"file_id": ids[index % len(ids)]})
+        return response.status_code
+    return request, max(int(1000 * scale), 1), 16
+
+async def scenario_list_deep(client: Client, scale: float):
+    token = await client.register("list@example.com")
+    user_id = await client.user_id(token)
+    await client.seed_files(token, max(int(2000 * scale), 100))
+
+    # Collect cursors all the way down so requests hit the last pages
+    cursors, cursor = [], None
+    while True:
+        page = (await client.client.get("/midi/user-midi", params={"user_id": user_id, "limit": 20, **({"cursor": cursor} if cursor else {})})).json()
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+        cursors.append(cursor)
+    deep = cursors[-10:]
+
+    async def request(index):
+        response = await client.client.get(
+            "/midi/user-midi", params={"user_id": user_id, "limit": 20, "cursor": deep[index % len(deep)]}
+        )
+        return response.status_code
+    return request, max(int(500 * scale), 1), 8
+
+async def scenario_tab(client: Client, scale: float):
+    # One 10k note song: the first request solves it, the rest come from the tab cache
+    headers = {"Authorization": f"Bearer {await client.register('tab@example.com')}"}
+    response = await client.client.post(
+        "/midi/generate", json={"name": "tab", "instrument_name": INSTRUMENT_NAME, "notes": song(10000, 0)}, headers=headers
+    )
+    response.raise_for_status()
+    file_id = (await client.client.get("/midi/list", params={"limit": 1})).json()["midi_files"][0]["id"]
+
+    async def request(index):
+        response = await client.client.get(f"/midi/tab/{file_id}")
+        return response.status_code
+    return request, max(int(200 * scale), 1), 8
+
+async def scenario_delete_user(client: Client, scale: float):
+    files = max(int(500 * scale), 10)
+    users = []
+    for index in range(3):
+        token = await client.register(f"delete-{index}@example.com")
+        await client.seed_files(token, files)
+        users.append(await client.user_id(token))
+
+    async def request(index):
+        # Measured until the background job has removed everything
+        response = await client.client.delete(f"/auth/delete-user/{users[index]}")
+        if response.status_code != 202:
+            return response.status_code
+        job_url = f"/auth/jobs/{response.json()['job_id']}"
+        while True:
+            job = (await client.client.get(job_url)).json()
+            if job["finished_at"] is not None:
+                return 200 if job["status"] == "done" else 500
+            await asyncio.sleep(0.005)
+    return request, len(users), 1
+
+SCENARIOS = {
+    "register": scenario_register,
+    "login": scenario_login,
+    "generate_small": _generate(notes=16, total=300, concurrency=8),
+    "generate_large": _generate(notes=5000, total=30, concurrency=4),
+    "get": scenario_get,
+    "list_deep": scenario_list_deep,
+    "tab": scenario_tab,
+    "delete_user": scenario_delete_user,
+}
+
+async def run(names: list, scale: float) -> dict:
+    from main import app
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http_client:
+            client = Client(http_client)
+            for name in names:
+                request, total, concurrency = await SCENARIOS[name](client, scale)
+                results[name] = await run_load(name, request, total, concurrency)
+                print_row(name, results[name])
+    return results
+
+# Latency may grow and throughput may drop by this share before it counts as a regression
+WATCHED = {"p50_ms": 1, "p99_ms": 1, "throughput_rps": -1}
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, direction in WATCHED.items():
+            before, after = previous[metric], current[metric]
+            if before and direction * (after - before) / before > tolerance:
+                regressions.append(f"{name}.{metric}: {before:.2f} -> {after:.2f}")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}.errors: {previous['errors']} -> {current['errors']}")
+    return regressions
+
+def print_row(name: str, result: dict):
+    print(
+        f"{name:<16} {result['throughput_rps']:>9.1f}/s {result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} "
+        f"{result['p99_ms']:>9.2f} {result['max_ms']:>9.2f} {result['peak_rss_mb']:>8.1f}MB {result['errors']:>6}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", help="Comma separated scenarios to run")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for request and seed counts")
+    parser.add_argument("--output", type=Path, default=BENCH_DIR / "results" / "latest.json")
+    parser.add_argument("--baseline", type=Path, default=BENCH_DIR / "baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    random.seed(0)
+    print(f"{'scenario':<16} {'throughput':>11} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'peak rss':>10} {'errors':>6}")
+    with tempfile.TemporaryDirectory(prefix="geb-bench-") as directory:
+        use_sqlite(Path(directory))
+        results = asyncio.run(run(names, args.scale))
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": args.scale,
+        "scenarios": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"results written to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print("no baseline to compare against; run with --save-baseline first")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("scale") != args.scale:
+        print(f"warning: baseline was recorded at scale {baseline.get('scale')}")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("no regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# MidiRequest's note cap is read from the settings, which need these; nothing here
+# touches a database or a token, so placeholders do unless the environment sets them
+for name, value in {
+    "MAIN_DB_URL": "unused",
+    "FILE_DB_URL": "unused",
+    "SECRET_KEY": "benchmark-secret",
+    "REFRESH_SECRET_KEY": "benchmark-refresh-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "REFRESH_TOKEN_EXPIRE_MINUTES": "600",
+}.items():
+    os.environ.setdefault(name, value)
+# The largest case is above the default per-request cap
+os.environ["MAX_NOTES_PER_REQUEST"] = "1000000"
+
+import numpy as np
+import pretty_midi
+from schemas import MidiRequest
+from utils.packed import pack_notes, unpack_notes
+from utils.smf import encode_notes, encode_request
+
+INSTRUMENT_NAME = 'Electric Guitar (clean)'
+
+def random_columns(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    pitches = rng.integers(40, 90, count)
+    starts = np.cumsum(rng.choice([0.0, 0.125, 0.25, 0.5], count))
+    durations = rng.choice([0.125, 0.25, 1.0, 3.3333], count)
+    velocities = rng.integers(1, 128, count)
+    return pitches, starts, durations, velocities
+
+def json_body(pitches, starts, durations, velocities) -> bytes:
+    # velocity / 127 survives the JSON path's int(velocity * 127) for every 0..127
+    return json.dumps({
+        "name": "bench",
+        "instrument_name": INSTRUMENT_NAME,
+        "notes": [
+            {"note": pretty_midi.note_number_to_name(int(pitch)), "time": float(start), "duration": float(duration), "velocity": int(velocity) / 127}
+            for pitch, start, duration, velocity in zip(pitches, starts, durations, velocities)
+        ],
+    }).encode()
+
+def ingest_json(body: bytes) -> bytes:
+    return encode_request(MidiRequest.model_validate_json(body))[0]
+
+def ingest_packed(body: bytes) -> bytes:
+    return encode_notes(*unpack_notes(body), INSTRUMENT_NAME)[0]
+
+def best_of(func, *args, repeat: int = 3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    # Both formats must produce the same file before the timings mean anything
+    for count in (0, 1, 17, 5000):
+        columns = random_columns(count, seed=count)
+        if ingest_json(json_body(*columns)) != ingest_packed(pack_notes(*columns)):
+            sys.exit(f"Output mismatch for {count} notes")
+    print("JSON and packed uploads encode to identical files")
+
+    print(f"{'notes':>8} {'json size':>10} {'packed size':>12} {'json':>10} {'packed':>10} {'speedup':>8}")
+    for count in (100, 1000, 10000, 100000):
+        columns = random_columns(count)
+        json_payload = json_body(*columns)
+        packed_payload = pack_notes(*columns)
+        json_time = best_of(ingest_json, json_payload)
+        packed_time = best_of(ingest_packed, packed_payload)
+        print(
+            f"{count:>8} {len(json_payload) // 1024:>8}KB {len(packed_payload) // 1024:>10}KB "
+            f"{json_time * 1000:>8.1f}ms {packed_time * 1000:>8.1f}ms {json_time / packed_time:>7.1f}x"
+        )
+
+if __name__ == "__main__":
+    main()
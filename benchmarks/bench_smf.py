@@ -0,0 +1,77 @@
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pretty_midi
+from schemas import NoteEvent
+from utils.smf import encode_midi, notes_to_arrays
+
+NOTE_NAMES = ['E2', 'A2', 'D3', 'G3', 'B3', 'E4', 'F#4', 'C#5', 'Bb3', 'G#2']
+
+def random_song(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    notes, t = [], 0.0
+    for _ in range(count):
+        # Coarse grid so plenty of events collide on the same tick
+        t += rng.choice([0.0, 0.0, 0.125, 0.25, 0.5])
+        notes.append(NoteEvent(
+            note=rng.choice(NOTE_NAMES),
+            time=t,
+            duration=rng.choice([0.0, 0.125, 0.25, 1.0, 3.3333]),
+            velocity=rng.random()
+        ))
+    return notes
+
+def encode_with_pretty_midi(notes, instrument_name):
+    midi = pretty_midi.PrettyMIDI()
+    instrument = pretty_midi.Instrument(program=pretty_midi.instrument_name_to_program(instrument_name))
+    for event in notes:
+        instrument.notes.append(pretty_midi.Note(
+            velocity=int(event.velocity * 127),
+            pitch=pretty_midi.note_name_to_number(event.note),
+            start=event.time,
+            end=event.time + event.duration
+        ))
+    midi.instruments.append(instrument)
+    stream = io.BytesIO()
+    midi.write(stream)
+    return stream.getvalue()
+
+def encode_with_smf(notes, instrument_name):
+    program = pretty_midi.instrument_name_to_program(instrument_name)
+    return encode_midi(*notes_to_arrays(notes), program=program)
+
+def best_of(func, *args, repeat: int = 3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    instrument_name = 'Electric Guitar (clean)'
+
+    # Output must match pretty_midi byte for byte before any timing is meaningful
+    for count in (0, 1, 2, 17, 500, 5000):
+        for seed in range(3):
+            notes = random_song(count, seed)
+            expected = encode_with_pretty_midi(notes, instrument_name)
+            actual = encode_with_smf(notes, instrument_name)
+            if expected != actual:
+                sys.exit(f"Output mismatch for {count} notes (seed {seed})")
+    print("byte-for-byte identical to pretty_midi")
+
+    print(f"{'notes':>8} {'pretty_midi':>12} {'smf':>10} {'speedup':>8}")
+    for count in (100, 1000, 10000, 50000):
+        notes = random_song(count)
+        reference = best_of(encode_with_pretty_midi, notes, instrument_name)
+        native = best_of(encode_with_smf, notes, instrument_name)
+        print(f"{count:>8} {reference * 1000:>10.1f}ms {native * 1000:>8.1f}ms {reference / native:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
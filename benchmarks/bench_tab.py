@@ -0,0 +1,94 @@
+import itertools
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from utils.tab import chord_frames, chord_voicings, open_strings, solve_tab, transition_costs
+
+# Scale degrees of a major key and a few open-position chord shapes, as MIDI pitches
+SCALE = [0, 2, 4, 5, 7, 9, 11]
+CHORDS = [(48, 52, 55, 60, 64), (43, 47, 50, 55, 59, 67), (45, 52, 57, 60, 64), (50, 57, 62, 66), (40, 47, 52, 55, 59, 64)]
+
+def random_song(count: int, bank: str, seed: int = 0):
+    # Stepwise melody with occasional leaps, broken up by strummed chords
+    rng = random.Random(seed)
+    low = open_strings(bank)[0]
+    pitches, starts = [], []
+    degree, t = 14, 0.0
+    while len(pitches) < count:
+        if rng.random() < 0.1:
+            chord = rng.choice(CHORDS)
+            shift = -24 if bank == "bass" else 0
+            for index, pitch in enumerate(chord[:count - len(pitches)]):
+                pitches.append(pitch + shift)
+                starts.append(t + index * 0.01)
+            t += rng.choice([0.5, 1.0])
+            continue
+        degree = min(max(degree + rng.choice([-2, -1, -1, 1, 1, 2, 5, -5]), 0), 27)
+        pitches.append(low + 12 * (degree // 7) + SCALE[degree % 7])
+        starts.append(t)
+        t += rng.choice([0.125, 0.25, 0.25, 0.5])
+    return np.array(pitches), np.array(starts)
+
+def steps_for(pitches, starts, bank: str):
+    steps = []
+    for frame in chord_frames(starts, len(open_strings(bank))):
+        frame = frame[np.argsort(pitches[frame], kind="stable")]
+        voicings = chord_voicings(bank, tuple(pitches[frame].tolist()))
+        if voicings is not None:
+            steps.append((voicings, starts[frame[0]]))
+    return steps
+
+def path_cost(steps, path) -> float:
+    cost = steps[0][0].cost[path[0]]
+    for (previous, previous_start), (current, start), a, b in zip(steps, steps[1:], path, path[1:]):
+        cost += transition_costs(previous, current, start - previous_start)[a, b] + current.cost[b]
+    return float(cost)
+
+def exhaustive_cost(steps) -> float:
+    return min(path_cost(steps, path) for path in itertools.product(*(range(len(voicings.cost)) for voicings, _ in steps)))
+
+def greedy_cost(steps) -> float:
+    # What a client placing each chord on its own cheapest voicing ends up with
+    return path_cost(steps, [0] * len(steps))
+
+def best_of(func, *args, repeat: int = 3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    # The DP must find the same optimum as trying every combination
+    checked = 0
+    for bank in ("acoustic", "bass"):
+        for seed in range(40):
+            pitches, starts = random_song(6, bank, seed)
+            steps = steps_for(pitches, starts, bank)
+            if np.prod([len(voicings.cost) for voicings, _ in steps]) > 100000:
+                continue
+            expected = exhaustive_cost(steps)
+            actual = solve_tab(pitches, starts, bank)["cost"]
+            if abs(expected - actual) > 1e-3:
+                sys.exit(f"Not optimal for {bank} (seed {seed}): {actual} vs {expected}")
+            checked += 1
+    print(f"matches exhaustive search on {checked} songs")
+
+    print(f"{'bank':>9} {'notes':>8} {'solve':>10} {'per note':>10} {'cost':>10} {'greedy':>10}")
+    for bank in ("acoustic", "electric", "bass"):
+        for count in (1000, 10000, 50000, 100000):
+            pitches, starts = random_song(count, bank)
+            chord_voicings.cache_clear()
+            elapsed = best_of(solve_tab, pitches, starts, bank)
+            cost = solve_tab(pitches, starts, bank)["cost"]
+            greedy = greedy_cost(steps_for(pitches, starts, bank))
+            print(f"{bank:>9} {count:>8} {elapsed * 1000:>8.1f}ms {elapsed / count * 1e6:>8.1f}us {cost:>10.1f} {greedy:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,122 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from db.models import MainBase, FileBase
+import asyncio
+import time
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from utils.config import settings
+from utils.metrics import Gauge, Histogram
 
-main_engine = create_engine(f'postgresql+psycopg://{settings.main_db_url}')
-file_db_engine = create_engine(f'postgresql+psycopg://{settings.file_db_url}')
+db_query_seconds = Histogram("db_query_duration_seconds", "Statement execution time", ("database",))
+db_pool_wait_seconds = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ("database",))
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=main_engine)
-FileSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=file_db_engine)
+def _timed_pool(database: str):
+    wait = db_pool_wait_seconds.labels(database)
 
-MainBase.metadata.create_all(bind=main_engine)
-FileBase.metadata.create_all(bind=file_db_engine)
+    class TimedPool(AsyncAdaptedQueuePool):
+        # Checkout is where requests queue up once the pool is exhausted
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                wait.observe(time.perf_counter() - started)
+
+    return TimedPool
+
+def _instrument(engine, database: str):
+    query_seconds = db_query_seconds.labels(database)
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        query_seconds.observe(time.perf_counter() - context._query_started)
+
+def _create_engine(url: str, database: str):
+    engine = create_async_engine(
+        f'postgresql+psycopg://{url}',
+        poolclass=_timed_pool(database),
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        # Enforced server side so a runaway query can't pin a pooled connection
+        connect_args={"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"},
+    )
+    _instrument(engine, database)
+    return engine
+
+# Created by init_engines() during startup rather than at import, so importing the app
+# neither reads the database settings nor loads the driver
+main_engine = None
+file_db_engine = None
+
+SessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+FileSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def init_engines():
+    global main_engine, file_db_engine
+    if main_engine is None:
+        main_engine = _create_engine(settings.main_db_url, "main")
+    if file_db_engine is None:
+        file_db_engine = _create_engine(settings.file_db_url, "file")
+    SessionLocal.configure(bind=main_engine)
+    FileSessionLocal.configure(bind=file_db_engine)
+
+def _engines():
+    return [(database, engine) for database, engine in (("main", main_engine), ("file", file_db_engine)) if engine is not None]
+
+def _pool_connections():
+    values = {}
+    for database, engine in _engines():
+        pool = engine.pool
+        values[(database, "checked_out")] = pool.checkedout()
+        values[(database, "idle")] = pool.checkedin()
+        values[(database, "overflow")] = max(pool.overflow(), 0)
+    return values
+
+def _pool_saturation():
+    # Share of the pool, overflow included, that is currently checked out
+    capacity = settings.db_pool_size + settings.db_max_overflow
+    return {
+        (database,): engine.pool.checkedout() / capacity
+        for database, engine in _engines()
+    }
+
+Gauge("db_pool_connections", "Pooled connections by state", ("database", "state"), collect=_pool_connections)
+Gauge("db_pool_saturation", "Checked-out connections over pool size plus overflow", ("database",), collect=_pool_saturation)
+
+async def _warm_pool(engine, connections: int):
+    # Connections have to be held at the same time, otherwise the pool hands back the same one
+    opened = await asyncio.gather(*(engine.connect().start() for _ in range(connections)), return_exceptions=True)
+    await asyncio.gather(*(conn.close() for conn in opened if not isinstance(conn, BaseException)))
+    for result in opened:
+        if isinstance(result, BaseException):
+            raise result
+
+async def warm_pools(connections: int):
+    # Opens the first connections of both pools concurrently, so the first requests
+    # after a cold start don't each pay for a connection handshake
+    connections = min(connections, settings.db_pool_size)
+    await asyncio.gather(*(_warm_pool(engine, connections) for _, engine in _engines()))
+
+async def ping_databases():
+    async def ping(engine):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping(engine) for _, engine in _engines()))
+
+async def dispose_engines():
+    await asyncio.gather(*(engine.dispose() for _, engine in _engines()))
 
 async def get_main_db():
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 async def get_file_db():
-    db = FileSessionLocal()
-    try:
+    async with FileSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,160 @@
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import MidiFile, MidiMetadata, MidiNoteState, MidiEdit
+from db.storage import read_file_data, replace_file_data
+from utils.analysis import summarize_notes
+from utils.cache import LRUCache
+from utils.config import settings
+from utils.notes import NoteArray, normalize_ops
+from utils.smf import DEFAULT_TEMPO, decode_midi, encode_midi
+
+# file_id -> (version, NoteArray); entries carry their version, so a stale one is
+# simply ignored instead of needing invalidation
+note_cache = LRUCache(lambda: settings.note_cache_max_bytes, lambda: settings.cache_ttl_seconds)
+
+class EditConflict(Exception):
+    def __init__(self, version: int):
+        super().__init__(f"File has changed; current version is {version}")
+        self.version = version
+
+def _decode_notes(data: bytes, first_id: int = 0):
+    pitches, starts, ends, velocities, program = decode_midi(data)
+    return NoteArray.from_columns(pitches, starts, ends, velocities, first_id), program
+
+async def get_note_state(file_db: AsyncSession, file_id, for_update: bool = False):
+    query = select(MidiNoteState).where(MidiNoteState.file_id == file_id)
+    if for_update:
+        query = query.with_for_update()
+    return await file_db.scalar(query)
+
+async def materialize(file_db: AsyncSession, state: MidiNoteState) -> NoteArray:
+    cached = note_cache.get(str(state.file_id))
+    if cached is not None and cached[0] == state.version:
+        return cached[1]
+
+    notes = NoteArray.from_bytes(state.snapshot)
+    if state.version > state.snapshot_version:
+        edits = (await file_db.scalars(
+            select(MidiEdit.ops)
+            .where(MidiEdit.file_id == state.file_id, MidiEdit.version > state.snapshot_version)
+            .order_by(MidiEdit.version)
+        )).all()
+        for ops in edits:
+            notes = notes.apply(ops)
+
+    note_cache.set(str(state.file_id), (state.version, notes), size=notes.nbytes)
+    return notes
+
+async def load_notes(file_db: AsyncSession, midi_file: MidiFile):
+    # Current (version, program, notes); files never edited are decoded on the fly
+    # with the same ids their state row would get
+    state = await get_note_state(file_db, midi_file.id)
+    if state is not None:
+        return state.version, state.program, await materialize(file_db, state)
+
+    notes, program = _decode_notes(await read_file_data(file_db, midi_file))
+    return 0, program, notes
+
+async def apply_edits(file_db: AsyncSession, midi_file: MidiFile, base_version: int, ops: list):
+    # Appends one edit-log row per accepted PATCH; the blob is only re-encoded when the
+    # file is next read (see flush_edits). Returns (new version, inserted note ids)
+    state = await get_note_state(file_db, midi_file.id)
+    if state is None:
+        if base_version != 0:
+            raise EditConflict(0)
+        notes, program = _decode_notes(await read_file_data(file_db, midi_file))
+        state = MidiNoteState(
+            file_id=midi_file.id,
+            version=0,
+            encoded_version=0,
+            snapshot=notes.to_bytes(),
+            snapshot_version=0,
+            program=program,
+            next_note_id=len(notes),
+        )
+        file_db.add(state)
+        await file_db.flush()
+    elif state.version != base_version:
+        raise EditConflict(state.version)
+
+    normalized, inserted = normalize_ops(ops, state.next_note_id)
+    try:
+        notes = (await materialize(file_db, state)).apply(normalized)
+    except KeyError as e:
+        raise ValueError(f"Note {e.args[0]} does not exist")
+
+    version = base_version + 1
+    # Only one writer can move the version on from base_version
+    result = await file_db.execute(
+        update(MidiNoteState)
+        .where(MidiNoteState.file_id == midi_file.id, MidiNoteState.version == base_version)
+        .values(version=version, next_note_id=MidiNoteState.next_note_id + len(inserted))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await file_db.rollback()
+        raise EditConflict((await get_note_state(file_db, midi_file.id)).version)
+
+    file_db.add(MidiEdit(file_id=midi_file.id, version=version, ops=normalized))
+    await file_db.flush()
+    if version - state.snapshot_version >= settings.note_snapshot_interval:
+        await _compact(file_db, midi_file.id, version, notes)
+    await file_db.commit()
+
+    note_cache.set(str(midi_file.id), (version, notes), size=notes.nbytes)
+    return version, inserted
+
+async def _compact(file_db: AsyncSession, file_id, snapshot_version: int, notes: NoteArray, **values):
+    # Folds the edit log into a fresh snapshot so replays stay short
+    await file_db.execute(
+        update(MidiNoteState)
+        .where(MidiNoteState.file_id == file_id)
+        .values(snapshot=notes.to_bytes(), snapshot_version=snapshot_version, **values)
+        .execution_options(synchronize_session=False)
+    )
+    await file_db.execute(delete(MidiEdit).where(MidiEdit.file_id == file_id, MidiEdit.version <= snapshot_version))
+
+async def flush_edits(db: AsyncSession, file_db: AsyncSession, metadata: MidiMetadata) -> bool:
+    # Lazily re-encodes a file whose edits haven't reached its blob yet
+    state = await get_note_state(file_db, metadata.file_id, for_update=True)
+    if state is None or state.encoded_version >= state.version:
+        return False
+
+    version, program = state.version, state.program
+    notes = await materialize(file_db, state)
+    file_data = encode_midi(*notes.columns(), program=program)
+
+    midi_file = await file_db.scalar(select(MidiFile).where(MidiFile.id == metadata.file_id))
+    metadata.content_hash = await replace_file_data(file_db, midi_file, file_data)
+    metadata.file_size = len(file_data)
+    pitches, starts, ends, _ = notes.columns()
+    for field, value in summarize_notes(pitches, starts, ends, program, DEFAULT_TEMPO).items():
+        setattr(metadata, field, value)
+
+    await _compact(file_db, metadata.file_id, version, notes, encoded_version=version)
+    await file_db.commit()
+    await db.commit()
+    return True
+
+async def reset_notes(file_db: AsyncSession, file_id, data: bytes, base_version: int = None) -> int:
+    # A whole-file replacement starts a new version with fresh note ids, so edits
+    # made against the old content can't land on the new one
+    state = await get_note_state(file_db, file_id, for_update=True)
+    current = state.version if state is not None else 0
+    if base_version is not None and base_version != current:
+        raise EditConflict(current)
+
+    first_id = state.next_note_id if state is not None else 0
+    try:
+        notes, program = _decode_notes(data, first_id)
+    except ValueError:
+        # Not MIDI; there is nothing to edit note by note until the next valid upload
+        notes, program = NoteArray.from_columns([], [], [], [], first_id), state.program if state is not None else 0
+
+    version = current + 1
+    values = {"version": version, "encoded_version": version, "program": program, "next_note_id": first_id + len(notes)}
+    if state is None:
+        file_db.add(MidiNoteState(file_id=file_id, snapshot=notes.to_bytes(), snapshot_version=version, **values))
+    else:
+        await _compact(file_db, file_id, version, notes, **values)
+    return version
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func
+from db.db import SessionLocal, FileSessionLocal
+from db.models import User, MidiBlob, MidiFile, MidiMetadata
+from db.storage import delete_files
+from utils.auth import principal_cache_keys
+from utils.cache import invalidation_bus
+from utils.codec import decompress
+from utils.analysis import UNREADABLE_SUMMARY
+from utils.config import settings
+from utils.jobs import Job, jobs
+from utils.smf import summarize_midi
+from utils.workers import run_in_process
+
+async def delete_user_files(user_id, job: Job):
+    # Removes a user's files in batches with set-based deletes. Metadata goes first:
+    # if this stops halfway the leftovers are unreferenced blobs, which the
+    # orphan sweeper collects, never metadata pointing at missing files.
+    batch_size = settings.delete_batch_size
+    async with SessionLocal() as db, FileSessionLocal() as file_db:
+        job.total = await db.scalar(select(func.count()).select_from(MidiMetadata).where(MidiMetadata.user_id == user_id))
+
+        while True:
+            rows = (await db.execute(
+                select(MidiMetadata.id, MidiMetadata.file_id)
+                .where(MidiMetadata.user_id == user_id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                break
+
+            await db.execute(delete(MidiMetadata).where(MidiMetadata.id.in_([row.id for row in rows])))
+            await db.commit()
+            await invalidation_bus.invalidate([row.id for row in rows])
+
+            await delete_files(file_db, [row.file_id for row in rows])
+            await file_db.commit()
+            job.advance(len(rows))
+
+        user = await db.scalar(select(User).where(User.id == user_id))
+        if user:
+            await db.delete(user)
+            await db.commit()
+            await invalidation_bus.invalidate(principal_cache_keys(user.id, user.email))
+
+def start_user_deletion(user_id) -> Job:
+    return jobs.start(Job("delete_user"), lambda job: delete_user_files(user_id, job))
+
+async def sweep_orphaned_files(job: Job):
+    # Walks midi_files in id order and deletes rows no metadata points at. Recent rows
+    # are skipped because /midi/generate commits the file before its metadata.
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.orphan_sweep_grace_seconds)
+    last_id = None
+    async with SessionLocal() as db, FileSessionLocal() as file_db:
+        while True:
+            query = select(MidiFile.id).where(MidiFile.created_at < cutoff)
+            if last_id is not None:
+                query = query.where(MidiFile.id > last_id)
+            file_ids = (await file_db.scalars(query.order_by(MidiFile.id).limit(settings.orphan_sweep_batch_size))).all()
+            if not file_ids:
+                break
+            last_id = file_ids[-1]
+
+            referenced = set((await db.scalars(
+                select(MidiMetadata.file_id).where(MidiMetadata.file_id.in_(file_ids))
+            )).all())
+            orphans = [file_id for file_id in file_ids if file_id not in referenced]
+            if orphans:
+                await delete_files(file_db, orphans)
+                await file_db.commit()
+                job.advance(len(orphans))
+
+async def backfill_summaries(job: Job):
+    # Fills the /midi/search columns of rows written before they existed. Files that
+    # don't parse or are missing get UNREADABLE_SUMMARY, so no later start retries them
+    last_id = None
+    async with SessionLocal() as db, FileSessionLocal() as file_db:
+        job.total = await db.scalar(select(func.count()).select_from(MidiMetadata).where(MidiMetadata.note_count.is_(None)))
+
+        while True:
+            query = select(MidiMetadata.id, MidiMetadata.file_id).where(MidiMetadata.note_count.is_(None))
+            if last_id is not None:
+                query = query.where(MidiMetadata.id > last_id)
+            rows = (await db.execute(query.order_by(MidiMetadata.id).limit(settings.summary_backfill_batch_size))).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            contents = {
+                file_id: decompress(codec, data) if data else None
+                for file_id, codec, data in (await file_db.execute(
+                    select(MidiFile.id, MidiBlob.codec, func.coalesce(MidiBlob.data, MidiFile.file_data))
+                    .outerjoin(MidiBlob, MidiBlob.hash == MidiFile.blob_hash)
+                    .where(MidiFile.id.in_([row.file_id for row in rows]))
+                )).all()
+            }
+            present = [row for row in rows if contents.get(row.file_id)]
+            summaries = await asyncio.gather(
+                *(run_in_process(summarize_midi, bytes(contents[row.file_id])) for row in present),
+                return_exceptions=True
+            )
+
+            updates = [{"id": row.id, **UNREADABLE_SUMMARY} for row in rows if not contents.get(row.file_id)]
+            for row, summary in zip(present, summaries):
+                if isinstance(summary, ValueError):
+                    updates.append({"id": row.id, **UNREADABLE_SUMMARY})
+                elif not isinstance(summary, BaseException):
+                    updates.append({"id": row.id, **summary})
+            if updates:
+                await db.execute(update(MidiMetadata), updates)
+                await db.commit()
+            job.advance(len(rows))
+
+async def run_orphan_sweeper():
+    while True:
+        await asyncio.sleep(settings.orphan_sweep_interval)
+        job = jobs.start(Job("orphan_sweep"), sweep_orphaned_files)
+        # Wait for the sweep so runs never overlap
+        while job.finished_at is None:
+            await asyncio.sleep(1)
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import importlib
+import pkgutil
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+import db.db as db_engines
+import db.migrations
+from db.models import MainBase, FileBase
+
+# Applied versions, one table per database
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+DATABASES = {"main": MainBase.metadata, "file": FileBase.metadata}
+# Serializes migrators started by several instances at once (PostgreSQL only)
+LOCK_KEY = 0x6765625f6d6967
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+def load_migrations(database: str) -> list:
+    # (version, name, module) in version order
+    found = []
+    for info in pkgutil.iter_modules(db.migrations.__path__):
+        number, _, _ = info.name.partition("_")
+        if number.isdigit():
+            module = importlib.import_module(f"db.migrations.{info.name}")
+            if module.database == database:
+                found.append((int(number), info.name, module))
+    return sorted(found, key=lambda migration: migration[0])
+
+def _engine(database: str):
+    return db_engines.main_engine if database == "main" else db_engines.file_db_engine
+
+def _lock(connection):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+
+def _is_fresh(connection, database: str) -> bool:
+    existing = set(inspect(connection).get_table_names())
+    return not existing.intersection(DATABASES[database].tables)
+
+def _applied(connection) -> set:
+    if not inspect(connection).has_table(schema_migrations.name):
+        return set()
+    return set(connection.scalars(select(schema_migrations.c.version)))
+
+def _record(connection, version: int, name: str):
+    connection.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+
+def _pending(connection, database: str) -> list:
+    applied = _applied(connection)
+    return [name for version, name, _ in load_migrations(database) if version not in applied]
+
+def _create_fresh(connection, database: str, migrations: list) -> bool:
+    # An empty database gets the current models in one go, marked as fully migrated
+    _lock(connection)
+    if not _is_fresh(connection, database):
+        return False
+    DATABASES[database].create_all(connection)
+    schema_migrations.create(connection)
+    for version, name, _ in migrations:
+        _record(connection, version, name)
+    return True
+
+def _apply(connection, version: int, name: str, module) -> bool:
+    _lock(connection)
+    schema_migrations.create(connection, checkfirst=True)
+    if version in _applied(connection):
+        return False
+    module.upgrade(connection)
+    _record(connection, version, name)
+    return True
+
+async def upgrade(database: str) -> list:
+    engine = _engine(database)
+    migrations = load_migrations(database)
+
+    async with engine.begin() as conn:
+        if await conn.run_sync(_create_fresh, database, migrations):
+            return [f"{name} (created)" for _, name, _ in migrations]
+
+    # One transaction per migration, so a failure leaves earlier ones applied
+    applied = []
+    for version, name, module in migrations:
+        async with engine.begin() as conn:
+            if await conn.run_sync(_apply, version, name, module):
+                applied.append(name)
+    return applied
+
+async def pending(database: str) -> list:
+    async with _engine(database).connect() as conn:
+        return await conn.run_sync(_pending, database)
+
+async def migrate() -> dict:
+    results = await asyncio.gather(*(upgrade(database) for database in DATABASES))
+    return dict(zip(DATABASES, results))
+
+async def check_schema(apply: bool = False):
+    # Startup check; the app never creates or alters tables on its own unless asked to
+    if apply:
+        await migrate()
+        return
+    results = await asyncio.gather(*(pending(database) for database in DATABASES))
+    missing = [f"{database}: {name}" for database, names in zip(DATABASES, results) for name in names]
+    if missing:
+        raise SchemaOutOfDate(f"Pending migrations ({', '.join(missing)}); run `python -m db.migrate`")
+
+async def main(show_status: bool):
+    db_engines.init_engines()
+    try:
+        if show_status:
+            for database in DATABASES:
+                names = await pending(database)
+                print(f"{database}: {', '.join(names) if names else 'up to date'}")
+            return
+
+        for database, applied in (await migrate()).items():
+            print(f"{database}: {', '.join(applied) if applied else 'nothing to apply'}")
+    finally:
+        await db_engines.dispose_engines()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to the main and file databases")
+    parser.add_argument("--status", action="store_true", help="Only list pending migrations")
+    asyncio.run(main(parser.parse_args().status))
@@ -0,0 +1,10 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, func
+from db.migrations import add_column, create_index
+
+database = "main"
+
+def upgrade(connection):
+    add_column(connection, "midi_metadata", Column("created_at", DateTime, nullable=False, default=datetime.utcnow, server_default=func.now()))
+    create_index(connection, "midi_metadata", "ix_midi_metadata_user_created", "user_id", "created_at", "id")
+    create_index(connection, "midi_metadata", "ix_midi_metadata_created", "created_at", "id")
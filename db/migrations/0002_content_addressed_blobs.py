@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table
+from db.migrations import add_column, create_index, create_table, drop_not_null
+
+database = "file"
+
+midi_blobs = Table(
+    "midi_blobs", MetaData(),
+    Column("hash", String(64), primary_key=True),
+    Column("data", LargeBinary, nullable=False),
+    Column("size", Integer, nullable=False),
+    Column("ref_count", Integer, nullable=False, default=0),
+    Column("created_at", DateTime, default=datetime.utcnow),
+)
+
+def upgrade(connection):
+    create_table(connection, midi_blobs)
+    add_column(connection, "midi_files", Column("blob_hash", String(64), nullable=True))
+    create_index(connection, "midi_files", "ix_midi_files_blob_hash", "blob_hash")
+    # New rows keep their content in midi_blobs instead
+    drop_not_null(connection, "midi_files", "file_data")
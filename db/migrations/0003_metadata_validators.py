@@ -0,0 +1,9 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from db.migrations import add_column
+
+database = "main"
+
+def upgrade(connection):
+    add_column(connection, "midi_metadata", Column("updated_at", DateTime, nullable=True))
+    add_column(connection, "midi_metadata", Column("content_hash", String(64), nullable=True))
+    add_column(connection, "midi_metadata", Column("file_size", Integer, nullable=True))
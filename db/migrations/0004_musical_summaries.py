@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Float, Integer, SmallInteger, String
+from db.migrations import add_column, create_index
+
+database = "main"
+
+def upgrade(connection):
+    # Existing rows are filled in by the summary backfill job once the app starts
+    for column in (
+        Column("duration", Float, nullable=True),
+        Column("note_count", Integer, nullable=True),
+        Column("pitch_min", SmallInteger, nullable=True),
+        Column("pitch_max", SmallInteger, nullable=True),
+        Column("program", SmallInteger, nullable=True),
+        Column("tempo", Float, nullable=True),
+        Column("musical_key", String(8), nullable=True),
+    ):
+        add_column(connection, "midi_metadata", column)
+
+    create_index(connection, "midi_metadata", "ix_midi_metadata_program", "program")
+    create_index(connection, "midi_metadata", "ix_midi_metadata_musical_key", "musical_key")
+    create_index(connection, "midi_metadata", "ix_midi_metadata_duration", "duration", "id")
+    create_index(connection, "midi_metadata", "ix_midi_metadata_note_count", "note_count", "id")
+    create_index(connection, "midi_metadata", "ix_midi_metadata_tempo", "tempo", "id")
+    create_index(connection, "midi_metadata", "ix_midi_metadata_pitch", "pitch_min", "pitch_max")
@@ -0,0 +1,31 @@
+from datetime import datetime
+from sqlalchemy import JSON, Column, DateTime, Integer, LargeBinary, MetaData, SmallInteger, Table
+from sqlalchemy.dialects.postgresql import UUID
+from db.migrations import create_table
+
+database = "file"
+
+metadata = MetaData()
+
+midi_note_states = Table(
+    "midi_note_states", metadata,
+    Column("file_id", UUID(as_uuid=True), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+    Column("encoded_version", Integer, nullable=False, default=0),
+    Column("snapshot", LargeBinary, nullable=False),
+    Column("snapshot_version", Integer, nullable=False, default=0),
+    Column("program", SmallInteger, nullable=False, default=0),
+    Column("next_note_id", Integer, nullable=False, default=0),
+)
+
+midi_edits = Table(
+    "midi_edits", metadata,
+    Column("file_id", UUID(as_uuid=True), primary_key=True),
+    Column("version", Integer, primary_key=True),
+    Column("ops", JSON, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+)
+
+def upgrade(connection):
+    create_table(connection, midi_note_states)
+    create_table(connection, midi_edits)
@@ -0,0 +1,9 @@
+from sqlalchemy import Column, Integer, String
+from db.migrations import add_column
+
+database = "file"
+
+def upgrade(connection):
+    # Existing rows keep codec NULL and are compressed lazily when first served
+    add_column(connection, "midi_blobs", Column("codec", String(16), nullable=True))
+    add_column(connection, "midi_blobs", Column("stored_size", Integer, nullable=True))
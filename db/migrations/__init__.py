@@ -0,0 +1,29 @@
+from sqlalchemy import Index, MetaData, Table, inspect
+
+# Each migration is a module named NNNN_description.py that sets `database` to "main"
+# or "file" and defines upgrade(connection) on a synchronous connection. Databases
+# created before migrations existed may already have some of the changes, so the
+# helpers below skip whatever is already there.
+
+def has_column(connection, table_name: str, column_name: str) -> bool:
+    return any(column["name"] == column_name for column in inspect(connection).get_columns(table_name))
+
+def add_column(connection, table_name: str, column):
+    if has_column(connection, table_name, column.name):
+        return
+    # Attached to a throwaway table so the dialect can render its full specification
+    Table(table_name, MetaData(), column)
+    specification = connection.dialect.ddl_compiler(connection.dialect, None).get_column_specification(column)
+    connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {specification}")
+
+def drop_not_null(connection, table_name: str, column_name: str):
+    for column in inspect(connection).get_columns(table_name):
+        if column["name"] == column_name and not column["nullable"]:
+            connection.exec_driver_sql(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} DROP NOT NULL")
+
+def create_index(connection, table_name: str, name: str, *column_names: str):
+    table = Table(table_name, MetaData(), autoload_with=connection)
+    Index(name, *(table.c[column_name] for column_name in column_names)).create(connection, checkfirst=True)
+
+def create_table(connection, table: Table):
+    table.create(connection, checkfirst=True)
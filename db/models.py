@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, ForeignKey, String, DateTime, LargeBinary, Enum as SQLAlchemyEnum
+from sqlalchemy import Column, ForeignKey, String, Integer, SmallInteger, Float, DateTime, JSON, LargeBinary, Index, func, Enum as SQLAlchemyEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
@@ -22,7 +22,7 @@ class User(MainBase):
     password = Column(String, nullable=False)
     role = Column(SQLAlchemyEnum(UserRole), default=UserRole.user)
 
-    midi_files = relationship("MidiMetadata", back_populates="user", cascade="all, delete-orphan")
+    midi_files = relationship("MidiMetadata", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 class MidiMetadata(MainBase):
     __tablename__ = "midi_metadata"
@@ -31,13 +31,76 @@ class MidiMetadata(MainBase):
     file_name = Column(String, nullable=False)
     file_id = Column(UUID, nullable=False)
     user_id = Column(UUID, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
+    # Copied from the file database so conditional requests never touch the blob
+    content_hash = Column(String(64), nullable=True)
+    file_size = Column(Integer, nullable=True)
+    # Musical summary computed when the file is written, so /midi/search never parses blobs
+    duration = Column(Float, nullable=True)
+    note_count = Column(Integer, nullable=True)
+    pitch_min = Column(SmallInteger, nullable=True)
+    pitch_max = Column(SmallInteger, nullable=True)
+    program = Column(SmallInteger, nullable=True, index=True)
+    tempo = Column(Float, nullable=True)
+    musical_key = Column(String(8), nullable=True, index=True)
 
     user = relationship("User", back_populates="midi_files")
 
+    # Keyset pagination indexes for /midi/list, /midi/user-midi and the /midi/search sort orders
+    __table_args__ = (
+        Index("ix_midi_metadata_user_created", "user_id", "created_at", "id"),
+        Index("ix_midi_metadata_created", "created_at", "id"),
+        Index("ix_midi_metadata_duration", "duration", "id"),
+        Index("ix_midi_metadata_note_count", "note_count", "id"),
+        Index("ix_midi_metadata_tempo", "tempo", "id"),
+        Index("ix_midi_metadata_pitch", "pitch_min", "pitch_max"),
+    )
+
 class MidiFile(FileBase):
     __tablename__ = "midi_files"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     file_name = Column(String, nullable=False)
-    file_data = Column(LargeBinary, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # Only set on rows written before content-addressed storage; new rows point at a MidiBlob
+    file_data = Column(LargeBinary, nullable=True)
+    blob_hash = Column(String(64), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MidiBlob(FileBase):
+    __tablename__ = "midi_blobs"
+
+    # SHA-256 of the content; identical files share one row
+    hash = Column(String(64), primary_key=True)
+    # Encoded with `codec` (see utils/codec.py); NULL means a raw row written before
+    # codecs, compressed the first time it is served
+    data = Column(LargeBinary, nullable=False)
+    codec = Column(String(16), nullable=True)
+    # Uncompressed and stored byte counts
+    size = Column(Integer, nullable=False)
+    stored_size = Column(Integer, nullable=True)
+    # Number of MidiFile rows pointing at this blob
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MidiNoteState(FileBase):
+    __tablename__ = "midi_note_states"
+
+    # Only files that have been edited note by note have a row
+    file_id = Column(UUID(as_uuid=True), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    # Version the blob was last encoded from; lags behind until the file is read
+    encoded_version = Column(Integer, nullable=False, default=0)
+    # Packed NoteArray at snapshot_version; later versions replay midi_edits on top
+    snapshot = Column(LargeBinary, nullable=False)
+    snapshot_version = Column(Integer, nullable=False, default=0)
+    program = Column(SmallInteger, nullable=False, default=0)
+    next_note_id = Column(Integer, nullable=False, default=0)
+
+class MidiEdit(FileBase):
+    __tablename__ = "midi_edits"
+
+    file_id = Column(UUID(as_uuid=True), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    ops = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import uuid
+from collections import Counter
+from contextlib import aclosing
+from sqlalchemy import select, update, delete, insert, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db import FileSessionLocal
+from db.models import MidiBlob, MidiFile, MidiMetadata, MidiNoteState, MidiEdit
+from utils.codec import compress, decompress, decompressor
+from utils.config import settings
+from utils.metrics import Histogram, SIZE_BUCKETS
+
+midi_file_bytes = Histogram("midi_file_bytes", "Size of newly stored MIDI files", ("encoding",), buckets=SIZE_BUCKETS)
+raw_file_bytes = midi_file_bytes.labels("raw")
+stored_file_bytes = midi_file_bytes.labels("stored")
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+async def encode_blob(data: bytes):
+    # lzma on large files would stall the event loop
+    if len(data) >= settings.lzma_min_bytes:
+        return await asyncio.to_thread(compress, data)
+    return compress(data)
+
+def _upsert(session: AsyncSession):
+    dialect = sqlite if session.bind.dialect.name == "sqlite" else postgresql
+    return dialect.insert(MidiBlob)
+
+async def acquire_blobs(file_db: AsyncSession, contents: list) -> list:
+    # Adds one reference per item and returns the hashes; only content that isn't
+    # stored yet is sent to the database
+    hashes = [content_hash(data) for data in contents]
+    counts = Counter(hashes)
+    if not counts:
+        return hashes
+
+    existing = set((await file_db.scalars(
+        update(MidiBlob)
+        .where(MidiBlob.hash.in_(counts))
+        .values(ref_count=MidiBlob.ref_count + case(counts, value=MidiBlob.hash))
+        .returning(MidiBlob.hash)
+    )).all())
+
+    new_blobs = {}
+    for blob_hash, data in zip(hashes, contents):
+        if blob_hash not in existing and blob_hash not in new_blobs:
+            # Only content that isn't stored yet is compressed
+            codec, payload = await encode_blob(data)
+            stored_file_bytes.observe(len(payload))
+            new_blobs[blob_hash] = {
+                "hash": blob_hash,
+                "data": payload,
+                "codec": codec,
+                "size": len(data),
+                "stored_size": len(payload),
+                "ref_count": counts[blob_hash],
+            }
+
+    if new_blobs:
+        # Another request may have stored the same content in the meantime
+        statement = _upsert(file_db)
+        statement = statement.on_conflict_do_update(
+            index_elements=[MidiBlob.hash],
+            set_={"ref_count": MidiBlob.ref_count + statement.excluded.ref_count}
+        )
+        await file_db.execute(statement, list(new_blobs.values()))
+
+    return hashes
+
+async def release_blobs(file_db: AsyncSession, hashes: list):
+    # Drops one reference per hash and deletes blobs nobody points at anymore
+    counts = Counter(blob_hash for blob_hash in hashes if blob_hash)
+    if not counts:
+        return
+
+    await file_db.execute(
+        update(MidiBlob)
+        .where(MidiBlob.hash.in_(counts))
+        .values(ref_count=MidiBlob.ref_count - case(counts, value=MidiBlob.hash))
+    )
+    await file_db.execute(
+        delete(MidiBlob).where(MidiBlob.hash.in_(counts), MidiBlob.ref_count <= 0)
+    )
+
+async def migrate_legacy_file(file_db: AsyncSession, midi_file: MidiFile):
+    # Moves the inline copy of a row written before the blob store into it
+    if midi_file.blob_hash is None:
+        midi_file.blob_hash, = await acquire_blobs(file_db, [midi_file.file_data])
+        midi_file.file_data = None
+        await file_db.commit()
+
+async def read_file_data(file_db: AsyncSession, midi_file: MidiFile) -> bytes:
+    if midi_file.blob_hash is None:
+        data = midi_file.file_data
+        await migrate_legacy_file(file_db, midi_file)
+        return data
+
+    row = (await file_db.execute(
+        select(MidiBlob.codec, MidiBlob.data).where(MidiBlob.hash == midi_file.blob_hash)
+    )).first()
+    return decompress(row.codec, row.data) if row else None
+
+async def blob_size(file_db: AsyncSession, blob_hash: str) -> int:
+    return await file_db.scalar(select(MidiBlob.size).where(MidiBlob.hash == blob_hash))
+
+async def blob_encoding(file_db: AsyncSession, blob_hash: str):
+    # Returns (codec, stored size); raw rows from before codecs are compressed on
+    # the way, so existing data migrates as it gets read
+    row = (await file_db.execute(
+        select(MidiBlob.codec, MidiBlob.stored_size).where(MidiBlob.hash == blob_hash)
+    )).first()
+    if row is None:
+        return None, None
+    if row.codec is not None:
+        return row.codec, row.stored_size
+
+    data = await file_db.scalar(select(MidiBlob.data).where(MidiBlob.hash == blob_hash))
+    codec, payload = await encode_blob(bytes(data))
+    await file_db.execute(
+        update(MidiBlob)
+        .where(MidiBlob.hash == blob_hash, MidiBlob.codec.is_(None))
+        .values(codec=codec, data=payload, stored_size=len(payload))
+    )
+    await file_db.commit()
+    return codec, len(payload)
+
+async def iter_stored(blob_hash: str, start: int, end: int, chunk_size: int = None):
+    # Streams stored bytes start..end (inclusive) without loading the whole blob; uses
+    # its own session because it runs after the request's dependencies are torn down
+    chunk_size = chunk_size or settings.blob_chunk_size
+    async with FileSessionLocal() as file_db:
+        offset = start
+        while offset <= end:
+            length = min(chunk_size, end - offset + 1)
+            chunk = await file_db.scalar(
+                select(func.substr(MidiBlob.data, offset + 1, length)).where(MidiBlob.hash == blob_hash)
+            )
+            if not chunk:
+                break
+            yield bytes(chunk)
+            offset += len(chunk)
+
+async def iter_blob(blob_hash: str, start: int, end: int, codec: str = None, stored_size: int = None, chunk_size: int = None):
+    # Streams decoded bytes start..end (inclusive)
+    decoder = decompressor(codec)
+    if decoder is None:
+        async for chunk in iter_stored(blob_hash, start, end, chunk_size):
+            yield chunk
+        return
+
+    # Compressed rows decode from the beginning; output before `start` is dropped.
+    # aclosing returns the reader's connection as soon as the range is complete
+    position = 0
+    async with aclosing(iter_stored(blob_hash, 0, stored_size - 1, chunk_size)) as chunks:
+        async for chunk in chunks:
+            data = decoder.decompress(chunk)
+            chunk_start, position = position, position + len(data)
+            if position > start:
+                yield data[max(start - chunk_start, 0):end - chunk_start + 1]
+            if position > end:
+                break
+
+async def replace_file_data(file_db: AsyncSession, midi_file: MidiFile, data: bytes) -> str:
+    old_hash = midi_file.blob_hash
+    midi_file.blob_hash, = await acquire_blobs(file_db, [data])
+    midi_file.file_data = None
+    await release_blobs(file_db, [old_hash])
+    return midi_file.blob_hash
+
+async def delete_files(file_db: AsyncSession, file_ids: list):
+    if not file_ids:
+        return
+
+    hashes = (await file_db.scalars(
+        delete(MidiFile).where(MidiFile.id.in_(file_ids)).returning(MidiFile.blob_hash)
+    )).all()
+    await release_blobs(file_db, hashes)
+    await file_db.execute(delete(MidiNoteState).where(MidiNoteState.file_id.in_(file_ids)))
+    await file_db.execute(delete(MidiEdit).where(MidiEdit.file_id.in_(file_ids)))
+
+async def store_midi_files(db: AsyncSession, file_db: AsyncSession, user_id, files: list) -> list:
+    # Persists (file_name, data, summary) triples for a user with one insert per
+    # table and one commit per database; returns the new file ids
+    if not files:
+        return []
+
+    hashes = await acquire_blobs(file_db, [data for _, data, _ in files])
+    for _, data, _ in files:
+        raw_file_bytes.observe(len(data))
+    file_ids = [uuid.uuid4() for _ in files]
+
+    await file_db.execute(insert(MidiFile), [
+        {"id": file_id, "file_name": file_name, "blob_hash": blob_hash}
+        for file_id, (file_name, _, _), blob_hash in zip(file_ids, files, hashes)
+    ])
+    await file_db.commit()
+
+    await db.execute(insert(MidiMetadata), [
+        {
+            "id": uuid.uuid4(),
+            "file_name": file_name,
+            "file_id": file_id,
+            "user_id": user_id,
+            "content_hash": blob_hash,
+            "file_size": len(data),
+            **summary,
+        }
+        for file_id, (file_name, data, summary), blob_hash in zip(file_ids, files, hashes)
+    ])
+    await db.commit()
+
+    return file_ids
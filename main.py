@@ -1,10 +1,65 @@
+# Imported first so the startup report's clock covers every other import
+from utils.startup import startup
+import asyncio
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from routers import auth, midi
+from routers import auth, midi, live, jam, metrics, health
+from db.db import init_engines, warm_pools, dispose_engines
+from db.migrate import check_schema
+from db.maintenance import run_orphan_sweeper, backfill_summaries
+from utils.admission import close_rate_limits
+from utils.password import shutdown_pool
+from utils.workers import shutdown_process_pool
+from utils.cache import invalidation_bus
+from utils.config import settings
+from utils.jobs import Job, jobs
+from utils.lazy import preload
+from utils.metrics import MetricsMiddleware
+from utils.sprites import SpriteFiles, SPRITE_DIR, ensure_sprites
 
-app = FastAPI()
+async def prepare_databases():
+    # Engine creation loads the driver, so it runs off the event loop too
+    await asyncio.to_thread(init_engines)
+    await asyncio.gather(
+        startup.timed("schema", check_schema(apply=settings.migrate_on_startup)),
+        startup.timed("pools", warm_pools(settings.db_pool_warm_connections)),
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Independent steps overlap: connecting is network bound while the deferred
+    # imports and the sprite check keep a thread busy
+    try:
+        with startup.phase("startup"):
+            await asyncio.gather(
+                startup.timed("databases", prepare_databases()),
+                startup.timed("deferred_imports", asyncio.to_thread(preload, "numpy", "pretty_midi")),
+                startup.timed("sprites", asyncio.to_thread(ensure_sprites)),
+                startup.timed("invalidation_bus", invalidation_bus.start()),
+            )
+    except BaseException:
+        await invalidation_bus.close()
+        await dispose_engines()
+        raise
+    app.state.orphan_sweeper = asyncio.create_task(run_orphan_sweeper())
+    jobs.start(Job("summary_backfill"), backfill_summaries)
+    startup.mark_ready()
+    print(startup.summary())
+
+    yield
+
+    app.state.orphan_sweeper.cancel()
+    await jobs.cancel_all()
+    await invalidation_bus.close()
+    await close_rate_limits()
+    await dispose_engines()
+    shutdown_pool()
+    shutdown_process_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 allowed_origins = [
 	'http://localhost:3000',
@@ -18,11 +73,20 @@ app.add_middleware(
 	allow_methods=["*"],
 	allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(midi.router)
+app.include_router(live.router)
+app.include_router(jam.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
+# Registered first so it takes precedence over the plain /static mount
+app.mount("/static/sprites", SpriteFiles(directory=SPRITE_DIR, check_dir=False), name="sprites")
 app.mount("/static", StaticFiles(directory="public"), name="static")
 
+startup.phases["import"] = startup.elapsed()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
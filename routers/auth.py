@@ -1,17 +1,21 @@
 from schemas import PostUser, LoginUser
-from utils.password import secure_pwd, verify_pwd
+from utils.password import secure_pwd, verify_and_update_pwd
 from fastapi import APIRouter, Depends, HTTPException, Request, status, Response
-from sqlalchemy.orm import Session
-from db.db import get_file_db, get_main_db
-from utils.auth import create_access_token, create_refresh_token, JWTBearer, decodeJWT
-from db.models import User, MidiMetadata, MidiFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db import get_main_db
+from utils.auth import create_access_token, create_refresh_token, decodeJWT, Principal, get_principal
+from db.models import User
+from db.maintenance import start_user_deletion
+from utils.jobs import jobs
+from utils.admission import rate_limit
 from uuid import uuid4
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-@router.post("/register")
-async def register_user(data: PostUser, db: Session = Depends(get_main_db), response: Response = None):
-    existing_user = db.query(User).filter(User.email == data.email).first()
+@router.post("/register", dependencies=[Depends(rate_limit("auth"))])
+async def register_user(data: PostUser, db: AsyncSession = Depends(get_main_db), response: Response = None):
+    existing_user = await db.scalar(select(User).where(User.email == data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -22,15 +26,15 @@ async def register_user(data: PostUser, db: Session = Depends(get_main_db), resp
         id=uuid4(),
         username=data.username,
         email=data.email,
-        password=secure_pwd(data.password),
+        password=await secure_pwd(data.password),
         role=data.role if data.role else "user"
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
-    access_token = create_access_token(new_user.email, new_user.role.value)
+    access_token = create_access_token(new_user.email, new_user.role.value, user_id=new_user.id)
     refresh_token = create_refresh_token(new_user.email)
 
     response.set_cookie(
@@ -43,16 +47,28 @@ async def register_user(data: PostUser, db: Session = Depends(get_main_db), resp
 
     return {"access_token": access_token, "detail": "User registered successfully"}
 
-@router.post("/login")
-async def login(data: LoginUser, db: Session = Depends(get_main_db), response: Response = None):
-    user = db.query(User).filter(User.email == data.email).first()
-    if not user or not verify_pwd(data.password, user.password):
+@router.post("/login", dependencies=[Depends(rate_limit("auth"))])
+async def login(data: LoginUser, db: AsyncSession = Depends(get_main_db), response: Response = None):
+    user = await db.scalar(select(User).where(User.email == data.email))
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect email or password"
+        )
+
+    is_valid, new_hash = await verify_and_update_pwd(data.password, user.password)
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect email or password"
         )
 
-    access_token = create_access_token(user.email, user.role.value)
+    # Transparently upgrade hashes created with an outdated cost factor
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
+    access_token = create_access_token(user.email, user.role.value, user_id=user.id)
     refresh_token = create_refresh_token(user.email)
 
     response.set_cookie(
@@ -65,8 +81,8 @@ async def login(data: LoginUser, db: Session = Depends(get_main_db), response: R
 
     return {"access_token": access_token, "detail": "Login successful"}
 
-@router.post("/refresh-token")
-async def refresh_access_token(db: Session = Depends(get_main_db), response: Response = None, request: Request = None):
+@router.post("/refresh-token", dependencies=[Depends(rate_limit("auth"))])
+async def refresh_access_token(db: AsyncSession = Depends(get_main_db), response: Response = None, request: Request = None):
     refresh_token = request.cookies.get("refresh_token")
     if not refresh_token:
         raise HTTPException(
@@ -88,65 +104,41 @@ async def refresh_access_token(db: Session = Depends(get_main_db), response: Res
             detail="Invalid token payload"
         )
     
-    user = db.query(User).filter(User.email == user_email).first()
+    user = await db.scalar(select(User).where(User.email == user_email))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    new_access_token = create_access_token(user.email, user.role.value)
+    new_access_token = create_access_token(user.email, user.role.value, user_id=user.id)
 
     return {"access_token": new_access_token, "detail": "Access token refreshed successfully"}
 
-@router.get("/user", dependencies=[Depends(JWTBearer())])
-async def get_user_data(db: Session = Depends(get_main_db), token: str = Depends(JWTBearer())):
-    payload = decodeJWT(token)
-    if not payload:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token"
-        )
-    
-    user_email = payload.get("sub")
-    if not user_email:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
-    
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
+@router.get("/user")
+async def get_user_data(principal: Principal = Depends(get_principal)):
     return {
-        "id": str(user.id),
-        "username": user.username,
-        "email": user.email
+        "id": str(principal.user_id),
+        "username": principal.username,
+        "email": principal.email
     }
 
-@router.delete("/delete-user/{user_id}")
-async def delete_user_and_files(user_id: str, db: Session = Depends(get_main_db), file_db: Session = Depends(get_file_db)):
+@router.delete("/delete-user/{user_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_user_and_files(user_id: str, db: AsyncSession = Depends(get_main_db)):
     # Find the user in the main database
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Find all metadata entries for the user
-    midi_metadata = db.query(MidiMetadata).filter(MidiMetadata.user_id == user_id).all()
+    # Files and metadata are removed in batches in the background; poll the job for progress
+    job = start_user_deletion(user.id)
 
-    # Delete the associated files from the file database
-    for metadata in midi_metadata:
-        file = file_db.query(MidiFile).filter(MidiFile.id == metadata.file_id).first()
-        if file:
-            file_db.delete(file)
-            file_db.commit()
+    return {"job_id": job.id, "detail": "User deletion started"}
 
-    # Delete the user (this will also delete metadata due to cascade)
-    db.delete(user)
-    db.commit()
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    return {"detail": "User and their MIDI files deleted successfully"}
\ No newline at end of file
+    return job.to_dict()
@@ -0,0 +1,24 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, status
+from sqlalchemy.exc import SQLAlchemyError
+from db.db import ping_databases
+from utils.config import settings
+from utils.startup import startup
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+@router.get("/live")
+async def liveness():
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def readiness():
+    if startup.ready_at is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Starting up")
+
+    try:
+        await asyncio.wait_for(ping_databases(), timeout=settings.readiness_timeout)
+    except (asyncio.TimeoutError, SQLAlchemyError, OSError):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database unavailable")
+
+    return {"status": "ready", "startup": startup.to_dict()}
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import math
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from db.db import SessionLocal, FileSessionLocal
+from db.storage import store_midi_files
+from schemas import NoteEvent
+from utils.admission import enforce_subject
+from utils.auth import decodeJWT, resolve_principal
+from utils.config import settings
+from utils.jam import Participant, rooms
+from utils.lazy import lazy_import
+from utils.smf import note_names_to_numbers
+
+pretty_midi = lazy_import("pretty_midi")
+
+router = APIRouter(prefix="/jam", tags=["JamSessions"])
+
+async def authenticate(websocket: WebSocket):
+    # Browsers can't set headers on WebSocket requests, so the token may also come as ?token=
+    token = websocket.query_params.get("token")
+    auth_header = websocket.headers.get("authorization")
+    if not token and auth_header and auth_header.startswith("Bearer "):
+        token = auth_header.split(' ')[1]
+
+    payload = decodeJWT(token) if token else None
+    if not payload or "sub" not in payload:
+        return None
+
+    async with SessionLocal() as db:
+        return await resolve_principal(payload, db)
+
+async def flush_recording(room, participant: Participant, name: str, reset: bool) -> dict:
+    recorded = room.recorder.count
+    file_data = room.recorder.encode(room.program)
+    summary = room.recorder.summarize(room.program)
+    if reset:
+        room.recorder.clear()
+
+    # Same storage path as /midi/generate; the file belongs to whoever flushed it
+    async with SessionLocal() as db, FileSessionLocal() as file_db:
+        file_id, = await store_midi_files(db, file_db, participant.user_id, [(name, file_data, summary)])
+
+    return {"type": "flushed", "id": str(file_id), "file_name": name, "notes": recorded}
+
+async def handle_message(room, participant: Participant, message: str):
+    payload = json.loads(message)
+    kind = payload.get("type", "note") if isinstance(payload, dict) else None
+
+    if kind == "note":
+        event = NoteEvent.model_validate(payload)
+        pitch = int(note_names_to_numbers([event.note])[0])
+        # Checked before recording, since one bad note would make every later flush fail
+        if not 0 <= pitch <= 127:
+            raise ValueError("pitch must be in range 0..127")
+        if event.time > settings.jam_max_note_seconds or event.duration > settings.jam_max_note_seconds:
+            raise ValueError(f"Notes can start at most {settings.jam_max_note_seconds:g}s ahead and last at most {settings.jam_max_note_seconds:g}s")
+        if room.recorder.count < settings.jam_max_recorded_notes:
+            # NoteEvent.time is a delay relative to arrival; clients normally send 0
+            room.recorder.append(pitch, room.clock() + max(event.time, 0.0), event.duration, int(event.velocity * 127))
+
+        # Encoded once, then queued as-is for every other participant
+        outgoing = json.dumps({
+            "type": "note",
+            "user": participant.username,
+            "note": event.note,
+            "pitch": pitch,
+            "time": event.time,
+            "duration": event.duration,
+            "velocity": event.velocity,
+        })
+        for lagging in room.broadcast(outgoing, sender=participant):
+            await lagging.websocket.close(code=1013, reason="Too slow to keep up with the session")
+    elif kind == "flush":
+        retry_after = await enforce_subject("jam_flush", participant.user_id)
+        if retry_after > 0:
+            raise ValueError(f"Too many flushes, retry in {math.ceil(retry_after)}s")
+        name = str(payload.get("name") or f"Jam {room.room_id}")
+        participant.deliver(json.dumps(await flush_recording(room, participant, name, bool(payload.get("reset")))))
+    else:
+        raise ValueError("Unknown message type")
+
+@router.websocket("/{room_id}/ws")
+async def jam_session(websocket: WebSocket, room_id: str, instrument_name: str = "Acoustic Guitar (nylon)"):
+    await websocket.accept()
+
+    principal = await authenticate(websocket)
+    if not principal:
+        await websocket.close(code=1008, reason="Invalid or expired token")
+        return
+
+    try:
+        program = pretty_midi.instrument_name_to_program(instrument_name)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    room = rooms.rooms.get(room_id)
+    if room and len(room.participants) >= settings.jam_max_participants:
+        await websocket.close(code=1013, reason="Room is full")
+        return
+
+    participant = Participant(websocket, principal.user_id, principal.username or principal.email, settings.jam_outbox_size)
+    room = rooms.join(room_id, program, participant)
+    room.broadcast(json.dumps({"type": "joined", "user": participant.username}), sender=participant)
+    pump = asyncio.create_task(participant.pump())
+
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                await handle_message(room, participant, message)
+            except (ValueError, ValidationError) as e:
+                participant.deliver(json.dumps({"type": "error", "detail": str(e)}))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        pump.cancel()
+        rooms.leave(room, participant)
+        room.broadcast(json.dumps({"type": "left", "user": participant.username}))
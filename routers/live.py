@@ -0,0 +1,160 @@
+import asyncio
+import json
+import time
+from typing import Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from schemas import NoteEvent
+from utils.audio import BANKS, SAMPLE_RATES, preload_bank
+from utils.config import settings
+from utils.mixer import BlockMixer
+from utils.smf import note_names_to_numbers
+
+router = APIRouter(prefix="/live", tags=["LiveRendering"])
+
+BLOCK_SIZES = (128, 256, 512, 1024, 2048)
+
+class StreamStats:
+    def __init__(self):
+        self.blocks = 0
+        self.render_total = 0.0
+        self.render_max = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.notes = 0
+        self.underruns = 0
+
+    def snapshot(self, block_ms: float) -> dict:
+        return {
+            "type": "stats",
+            "blocks": self.blocks,
+            "block_ms": block_ms,
+            "render_ms_avg": self.render_total / self.blocks * 1000 if self.blocks else 0.0,
+            "render_ms_max": self.render_max * 1000,
+            "note_latency_ms_avg": self.latency_total / self.notes * 1000 if self.notes else 0.0,
+            "note_latency_ms_max": self.latency_max * 1000,
+            "underruns": self.underruns,
+        }
+
+def parse_notes(message: str) -> list:
+    # Accepts one NoteEvent-shaped object or a list of them
+    payload = json.loads(message)
+    events = [NoteEvent.model_validate(item) for item in (payload if isinstance(payload, list) else [payload])]
+    pitches = note_names_to_numbers([event.note for event in events]) if events else []
+    return list(zip(events, pitches))
+
+async def receive_notes(websocket: WebSocket, queue: asyncio.Queue):
+    while True:
+        message = await websocket.receive_text()
+        try:
+            notes = parse_notes(message)
+        except (ValueError, ValidationError) as e:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            continue
+
+        received_at = time.perf_counter()
+        for event, pitch in notes:
+            # Blocks while the queue is full, which stops reading from the socket
+            # and pushes back on the client
+            await queue.put((event, int(pitch), received_at))
+
+async def stream_blocks(websocket: WebSocket, queue: asyncio.Queue, mixer: BlockMixer):
+    sample_rate = mixer.sample_rate
+    block_seconds = mixer.block_size / sample_rate
+    lead_frames = settings.live_lead_blocks * mixer.block_size
+    stats = StreamStats()
+    pending = []  # (start frame, received at) of notes whose first block hasn't been sent
+
+    started = time.perf_counter()
+    last_report = started
+    arrived = []
+    while True:
+        while not queue.empty():
+            arrived.append(queue.get_nowait())
+        for event, pitch, received_at in arrived:
+            start_frame = max(int(round(event.time * sample_rate)), mixer.frame)
+            mixer.note_on(pitch, start_frame, int(event.duration * sample_rate), min(max(event.velocity, 0.0), 1.0))
+            pending.append((start_frame, received_at))
+        arrived.clear()
+
+        # Stay a fixed number of blocks ahead of the wall clock
+        elapsed_frames = int((time.perf_counter() - started) * sample_rate)
+        if mixer.frame < elapsed_frames:
+            stats.underruns += 1
+        target = elapsed_frames + lead_frames
+
+        while mixer.frame < target:
+            render_started = time.perf_counter()
+            block = mixer.render()
+            render_time = time.perf_counter() - render_started
+            stats.blocks += 1
+            stats.render_total += render_time
+            stats.render_max = max(stats.render_max, render_time)
+
+            await websocket.send_bytes(block.tobytes())
+
+            if pending:
+                now = time.perf_counter()
+                still_pending = []
+                for start_frame, received_at in pending:
+                    if start_frame < mixer.frame:
+                        stats.notes += 1
+                        stats.latency_total += now - received_at
+                        stats.latency_max = max(stats.latency_max, now - received_at)
+                    else:
+                        still_pending.append((start_frame, received_at))
+                pending = still_pending
+
+        now = time.perf_counter()
+        if now - last_report >= settings.live_stats_interval:
+            await websocket.send_json(stats.snapshot(block_seconds * 1000))
+            last_report = now
+
+        # Wake up for the next block, or earlier when a note arrives
+        try:
+            arrived.append(await asyncio.wait_for(queue.get(), timeout=block_seconds))
+        except asyncio.TimeoutError:
+            pass
+
+@router.websocket("/ws")
+async def live_render(
+    websocket: WebSocket,
+    bank: str = "acoustic",
+    sample_rate: int = 44100,
+    block_size: Optional[int] = None
+):
+    await websocket.accept()
+    if block_size is None:
+        block_size = settings.live_block_size
+    if bank not in BANKS or sample_rate not in SAMPLE_RATES or block_size not in BLOCK_SIZES:
+        await websocket.close(code=1008, reason="Unsupported bank, sample rate or block size")
+        return
+
+    # Decoded and resampled once per process; later connections reuse the same buffers
+    await asyncio.to_thread(preload_bank, bank, sample_rate)
+    mixer = BlockMixer(bank, sample_rate, block_size, settings.live_max_voices)
+    queue = asyncio.Queue(maxsize=settings.live_queue_size)
+
+    await websocket.send_json({
+        "type": "ready",
+        "format": "s16le",
+        "channels": 1,
+        "sample_rate": sample_rate,
+        "block_size": block_size,
+        "lead_blocks": settings.live_lead_blocks,
+    })
+
+    tasks = [
+        asyncio.create_task(receive_notes(websocket, queue)),
+        asyncio.create_task(stream_blocks(websocket, queue, mixer)),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Response
+from db.edits import note_cache
+from utils.auth import principal_cache
+from utils.cache import metadata_cache, blob_cache, tab_cache
+from utils.metrics import CONTENT_TYPE, CollectedCounter, Gauge, render
+from utils.startup import startup
+
+router = APIRouter(tags=["Metrics"])
+
+CACHES = {
+    "metadata": metadata_cache,
+    "blob": blob_cache,
+    "principal": principal_cache,
+    "notes": note_cache,
+    "tab": tab_cache,
+}
+
+def _cache_stat(field: str):
+    return lambda: {(name,): cache.stats()[field] for name, cache in CACHES.items()}
+
+# LRUCache already counts these; they are only read at scrape time
+CollectedCounter("cache_hits_total", "Cache hits", ("cache",), collect=_cache_stat("hits"))
+CollectedCounter("cache_misses_total", "Cache misses", ("cache",), collect=_cache_stat("misses"))
+CollectedCounter("cache_evictions_total", "Entries evicted for space", ("cache",), collect=_cache_stat("evictions"))
+Gauge("cache_bytes", "Accounted size of cached entries", ("cache",), collect=_cache_stat("bytes"))
+Gauge("cache_entries", "Entries currently cached", ("cache",), collect=_cache_stat("entries"))
+
+def _startup_seconds():
+    values = {(name,): seconds for name, seconds in startup.phases.items()}
+    if startup.ready_at is not None:
+        values[("ready",)] = startup.ready_at
+    if startup.first_request_at is not None:
+        values[("first_request",)] = startup.first_request_at
+    return values
+
+# ready and first_request count from the start of the app import, the rest are phase durations
+Gauge("startup_seconds", "Startup phase durations and time to readiness and first request", ("phase",), collect=_startup_seconds)
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render(), media_type=CONTENT_TYPE)
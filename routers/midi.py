@@ -1,206 +1,915 @@
-import pretty_midi
+import asyncio
+import json
 import uuid
-import io
-from fastapi import APIRouter, Depends, HTTPException, Request
+from functools import partial
+from pathlib import PurePosixPath
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
-from db.db import get_main_db, get_file_db
-from sqlalchemy.orm import Session
-from db.models import MidiFile, MidiMetadata, User, UserRole
-from utils.auth import JWTBearer, decodeJWT
-from schemas import MidiRequest, UpdateMidiRequest
+from db.db import SessionLocal, FileSessionLocal, get_main_db, get_file_db
+from db.edits import EditConflict, apply_edits, flush_edits, load_notes, reset_notes
+from db.storage import store_midi_files, replace_file_data, delete_files, migrate_legacy_file, blob_size, blob_encoding, iter_blob, iter_stored
+from utils.cache import metadata_cache, blob_cache, tab_cache, invalidation_bus
+from utils.http import http_date, etag_matches, accepts_encoding, not_modified_since, parse_range
+from utils.codec import HTTP_ENCODINGS, decompress
+from sqlalchemy import select, func, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import MidiBlob, MidiFile, MidiMetadata, MidiNoteState, UserRole
+from utils.admission import charge_notes, decode_cost, encode_cost, encode_slots, rate_limit, render_cost, render_slots
+from utils.auth import Principal, get_principal
+from utils.smf import encode_notes, encode_request, summarize_midi
+from utils.packed import PACKED_CONTENT_TYPE, packed_size, unpack_notes
+from utils.analysis import SUMMARY_FIELDS, UNREADABLE_SUMMARY, normalize_key_name
+from utils.audio import BANKS, SAMPLE_RATES, render_midi
+from utils.tab import tab_for_midi, tab_for_request
+from utils.workers import run_in_process
+from utils.zipstream import iter_zip_entries, stream_zip
+from utils.config import settings
+from utils.metrics import Histogram, Timer
+from utils.pagination import CountCache, decode_cursor, encode_cursor, decode_search_cursor, encode_search_cursor, validate_limit
+from schemas import MidiRequest, TabRequest, UpdateMidiRequest
 
 router = APIRouter(prefix="/midi", tags=["MIDIHandling"])
 
+midi_encode_seconds = Histogram("midi_encode_duration_seconds", "Request parsing and MIDI encoding time", ("format",))
+json_encode_seconds = midi_encode_seconds.labels("json")
+packed_encode_seconds = midi_encode_seconds.labels("packed")
+
 def validate_uuid(file_id: str):
     try:
         uuid.UUID(file_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid file_id format")
 
-async def get_current_user_id(token: str = Depends(JWTBearer()), db: Session = Depends(get_main_db)):
-    payload = decodeJWT(token)
-    if not payload or "sub" not in payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Get the user's email from the token payload
-    email = payload["sub"]
-
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def get_current_user_id(principal: Principal = Depends(get_principal)):
+    return principal.user_id
 
-    return user.id
-
-@router.post("/generate", dependencies=[Depends(JWTBearer())])
+@router.post("/generate", dependencies=[Depends(rate_limit("generate"))])
 async def generate_midi(
     midi_data: MidiRequest,
-    db: Session = Depends(get_main_db),
-    file_db: Session = Depends(get_file_db),
+    request: Request,
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db),
     user_id: str = Depends(get_current_user_id)
 ):
-    midi = pretty_midi.PrettyMIDI()
-    program = pretty_midi.instrument_name_to_program(midi_data.instrument_name)
-    instrument = pretty_midi.Instrument(program=program)
-
-    for event in midi_data.notes:
-        pitch = pretty_midi.note_name_to_number(event.note)
-        note = pretty_midi.Note(
-            velocity=int(event.velocity * 127),
-            pitch=pitch,
-            start=event.time,
-            end=event.time + event.duration
-        )
-        instrument.notes.append(note)
+    await charge_notes(request, len(midi_data.notes))
+    try:
+        # Same admission and worker processes as /generate-batch
+        async with encode_slots.hold(encode_cost(len(midi_data.notes))):
+            with Timer(json_encode_seconds):
+                file_data, summary = await run_in_process(encode_request, midi_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Save the file in the blob store and its metadata in the main database
+    file_id, = await store_midi_files(db, file_db, user_id, [(midi_data.name, file_data, summary)])
+
+    return {"detail": "MIDI file generated and saved successfully", 'id': str(file_id), "file_name": midi_data.name}
+
+@router.post(
+    "/generate/packed",
+    dependencies=[Depends(rate_limit("generate"))],
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {PACKED_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}},
+    }}
+)
+async def generate_midi_packed(
+    request: Request,
+    name: str,
+    instrument_name: str,
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    # Same as /generate, but the notes arrive as packed columns (see utils/packed.py)
+    # and skip per-note JSON parsing and validation entirely
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > packed_size(settings.max_packed_notes):
+        raise HTTPException(status_code=413, detail=f"At most {settings.max_packed_notes} notes can be uploaded at once")
 
-    midi.instruments.append(instrument)
+    body = await request.body()
+    try:
+        with Timer(packed_encode_seconds):
+            columns = unpack_notes(body, settings.max_packed_notes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Save the MIDI file to a binary stream
-    midi_stream = io.BytesIO()
-    midi.write(midi_stream)
-    midi_stream.seek(0)
+    await charge_notes(request, len(columns[0]))
+    try:
+        async with encode_slots.hold(encode_cost(len(columns[0]))):
+            with Timer(packed_encode_seconds):
+                file_data, summary = await run_in_process(encode_notes, *columns, instrument_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    file_id, = await store_midi_files(db, file_db, user_id, [(name, file_data, summary)])
+
+    return {"detail": "MIDI file generated and saved successfully", 'id': str(file_id), "file_name": name}
+
+@router.post("/generate-batch", dependencies=[Depends(rate_limit("generate"))])
+async def generate_midi_batch(
+    batch: List[MidiRequest],
+    request: Request,
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    if not batch:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one item")
+    if len(batch) > settings.max_batch_size:
+        raise HTTPException(status_code=400, detail=f"Batch can contain at most {settings.max_batch_size} items")
+    notes = sum(len(midi_data.notes) for midi_data in batch)
+    if notes > settings.max_batch_notes:
+        raise HTTPException(status_code=413, detail=f"Batch can contain at most {settings.max_batch_notes} notes")
+    await charge_notes(request, notes)
+
+    # Encode every item in parallel across the worker processes
+    async with encode_slots.hold(encode_cost(notes)):
+        encoded = await asyncio.gather(
+            *(run_in_process(encode_request, midi_data) for midi_data in batch),
+            return_exceptions=True
+        )
 
-    # Save the binary data in the file database
-    file_id = str(uuid.uuid4())
-    midi_file = MidiFile(
-        id=file_id,
-        file_name=midi_data.name,
-        file_data=midi_stream.read()
-    )
-    file_db.add(midi_file)
-    file_db.commit()
-
-    # Save the metadata in the main database
-    metadata = MidiMetadata(
-        id=str(uuid.uuid4()),
-        file_name=midi_data.name,
-        file_id=file_id,
-        user_id=user_id  # Associate the metadata with the user
-    )
-    db.add(metadata)
-    db.commit()
+    results = [None] * len(batch)
+    files = []
+    stored_indexes = []
+    for index, (midi_data, result) in enumerate(zip(batch, encoded)):
+        if isinstance(result, ValueError):
+            results[index] = {"index": index, "error": str(result)}
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            files.append((midi_data.name, *result))
+            stored_indexes.append(index)
+
+    # One bulk insert and one commit per database
+    file_ids = await store_midi_files(db, file_db, user_id, files)
+    for index, file_id in zip(stored_indexes, file_ids):
+        results[index] = {"index": index, "id": str(file_id), "file_name": batch[index].name}
+
+    return {
+        "detail": f"{len(files)} of {len(batch)} MIDI files generated and saved successfully",
+        "results": results
+    }
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+# Skipped entries listed in an import response; the rest are only counted
+IMPORT_SKIPS_LISTED = 100
+
+def is_archive_noise(name: str) -> bool:
+    # Resource forks and hidden files that archivers add on their own
+    parts = PurePosixPath(name).parts
+    return not parts or parts[0] == "__MACOSX" or any(part.startswith(".") for part in parts)
+
+async def limit_upload(chunks, max_bytes: int):
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Archives can be at most {max_bytes} bytes")
+        yield chunk
+
+@router.post(
+    "/import",
+    dependencies=[Depends(rate_limit("bulk"))],
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/zip": {"schema": {"type": "string", "format": "binary"}}},
+    }}
+)
+async def import_midi_files(
+    request: Request,
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    # The archive is read as it arrives and stored a batch at a time, so only one
+    # batch of files, bounded by count and by bytes, is ever held in memory
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.max_import_bytes:
+        raise HTTPException(status_code=413, detail=f"Archives can be at most {settings.max_import_bytes} bytes")
+
+    imported = 0
+    skipped = []
+    skipped_count = 0
+    pending = []
+    pending_bytes = 0
+
+    def skip(name: str, error: str):
+        nonlocal skipped_count
+        skipped_count += 1
+        if len(skipped) < IMPORT_SKIPS_LISTED:
+            skipped.append({"name": name, "error": error})
+
+    async def store_pending():
+        nonlocal imported, pending_bytes
+        async with encode_slots.hold(decode_cost(pending_bytes)):
+            summaries = await asyncio.gather(
+                *(run_in_process(summarize_midi, data) for _, data in pending),
+                return_exceptions=True
+            )
+
+        files = []
+        for (name, data), summary in zip(pending, summaries):
+            if isinstance(summary, ValueError):
+                skip(name, str(summary))
+            elif isinstance(summary, BaseException):
+                raise summary
+            else:
+                files.append((PurePosixPath(name).stem, data, summary))
+        pending.clear()
+        pending_bytes = 0
+
+        await store_midi_files(db, file_db, user_id, files)
+        imported += len(files)
+
+    seen = 0
+    entries = iter_zip_entries(limit_upload(request.stream(), settings.max_import_bytes), settings.max_import_file_bytes)
+    try:
+        async for name, data, error in entries:
+            # Every entry counts, so archives of non-MIDI files can't run on forever
+            seen += 1
+            if seen > settings.max_import_files:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Archives can contain at most {settings.max_import_files} files; {imported} were imported"
+                )
+            if is_archive_noise(name):
+                continue
+            if not name.lower().endswith(MIDI_EXTENSIONS):
+                skip(name, "Not a MIDI file")
+                continue
+            if error is not None:
+                skip(name, error)
+                continue
+
+            pending.append((name, data))
+            pending_bytes += len(data)
+            if len(pending) >= settings.import_batch_size or pending_bytes >= settings.import_batch_bytes:
+                await store_pending()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e}; {imported} files were imported")
+
+    if pending:
+        await store_pending()
+    if not imported and not skipped_count:
+        raise HTTPException(status_code=400, detail="Archive contains no MIDI files")
+
+    return {
+        "detail": f"{imported} MIDI files imported successfully",
+        "imported": imported,
+        "skipped": skipped,
+        "skipped_count": skipped_count
+    }
+
+# Rough per-entry footprint used to bound the metadata cache
+METADATA_ENTRY_SIZE = 512
+
+async def load_served_metadata(file_id: str, db: AsyncSession, file_db: AsyncSession) -> dict:
+    # Get the metadata from the main database
+    metadata = await db.scalar(select(MidiMetadata).where(MidiMetadata.id == file_id))
+    if not metadata:
+        raise HTTPException(status_code=404, detail="MIDI file not found")
 
-    return {"detail": "MIDI file generated and saved successfully", 'id': metadata.file_id, "file_name": midi_data.name}
+    if metadata.content_hash is None:
+        # Written before hashes were tracked in the metadata; backfill them once
+        midi_file = await file_db.scalar(select(MidiFile).where(MidiFile.id == metadata.file_id))
+        if not midi_file:
+            raise HTTPException(status_code=404, detail="MIDI file not found in file database")
+
+        await migrate_legacy_file(file_db, midi_file)
+        metadata.content_hash = midi_file.blob_hash
+        metadata.file_size = await blob_size(file_db, midi_file.blob_hash)
+        await db.commit()
+
+    # Note edits are folded into the blob the first time the file is read afterwards
+    await flush_edits(db, file_db, metadata)
+    codec, stored_size = await blob_encoding(file_db, metadata.content_hash)
+    if stored_size is None:
+        raise HTTPException(status_code=404, detail="MIDI file not found in file database")
+
+    return served_fields(metadata, codec, stored_size)
+
+def served_fields(metadata: MidiMetadata, codec: str, stored_size: int) -> dict:
+    return {
+        "file_name": metadata.file_name,
+        "content_hash": metadata.content_hash,
+        "file_size": metadata.file_size,
+        "codec": codec,
+        "stored_size": stored_size,
+        "last_modified": metadata.updated_at or metadata.created_at,
+    }
+
+async def get_served_metadata(file_id: str, db: AsyncSession, file_db: AsyncSession) -> dict:
+    # Canonical form so invalidations (keyed by str(metadata.id)) always match
+    cache_key = str(uuid.UUID(file_id))
+    metadata = metadata_cache.get(cache_key)
+    if metadata is None:
+        metadata = await load_served_metadata(file_id, db, file_db)
+        metadata_cache.set(cache_key, metadata, size=METADATA_ENTRY_SIZE)
+    return metadata
+
+async def load_stored_blob(file_db: AsyncSession, content_hash: str) -> bytes:
+    # The cache holds blobs as stored, so compressed ones take up less of it
+    data = blob_cache.get(content_hash)
+    if data is None:
+        data = await file_db.scalar(select(MidiBlob.data).where(MidiBlob.hash == content_hash))
+        if data is None:
+            raise HTTPException(status_code=404, detail="MIDI file not found in file database")
+        if len(data) <= settings.cache_max_item_bytes:
+            blob_cache.set(content_hash, data, size=len(data))
+    return data
+
+async def load_blob(file_db: AsyncSession, metadata: dict) -> bytes:
+    return decompress(metadata["codec"], await load_stored_blob(file_db, metadata["content_hash"]))
 
 @router.get("/get")
 async def get_midi_file_by_id(
     file_id: str,
-    db: Session = Depends(get_main_db),
-    file_db: Session = Depends(get_file_db)
+    request: Request,
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db)
 ):
     validate_uuid(file_id)
-    
-    # Get the metadata from the main database
-    metadata = db.query(MidiMetadata).filter(MidiMetadata.id == file_id).first()
-    if not metadata:
-        raise HTTPException(status_code=404, detail="MIDI file not found")
 
-    # Get the binary data from the file database
-    midi_file = file_db.query(MidiFile).filter(MidiFile.id == metadata.file_id).first()
-    if not midi_file:
-        raise HTTPException(status_code=404, detail="MIDI file not found in file database")
+    metadata = await get_served_metadata(file_id, db, file_db)
+
+    # Compressed rows whose codec is an HTTP content coding go out exactly as stored
+    # when the client accepts it; ranges always refer to the decoded file
+    encoding = HTTP_ENCODINGS.get(metadata["codec"])
+    passthrough = (
+        encoding is not None
+        and "range" not in request.headers
+        and accepts_encoding(request.headers.get("accept-encoding"), encoding)
+    )
+
+    # Each representation needs its own strong validator
+    etag = f'"{metadata["content_hash"]}-{encoding}"' if passthrough else f'"{metadata["content_hash"]}"'
+    last_modified = metadata["last_modified"]
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": "public, no-cache",
+        "Accept-Ranges": "bytes",
+    }
+    if encoding is not None:
+        headers["Vary"] = "Accept-Encoding"
+
+    # Conditional requests are answered from the metadata alone
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) or (
+        if_none_match is None and not_modified_since(request.headers.get("if-modified-since"), last_modified)
+    ):
+        return Response(status_code=304, headers=headers)
+
+    size = metadata["file_size"]
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        byte_range = parse_range(request.headers.get("range"), size)
+
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Disposition"] = f"attachment; filename={metadata['file_name']}.mid"
+
+    if passthrough:
+        stored_size = metadata["stored_size"]
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(stored_size)
+        if stored_size <= settings.cache_max_item_bytes:
+            data = await load_stored_blob(file_db, metadata["content_hash"])
+            return Response(data, media_type="audio/midi", headers=headers)
+        return StreamingResponse(
+            iter_stored(metadata["content_hash"], 0, stored_size - 1),
+            media_type="audio/midi",
+            headers=headers
+        )
 
-    midi_stream = io.BytesIO(midi_file.file_data)
-    midi_stream.seek(0)
+    headers["Content-Length"] = str(end - start + 1)
+
+    # Small files are served from memory; anything larger streams from the file database
+    if metadata["stored_size"] <= settings.cache_max_item_bytes:
+        data = await load_blob(file_db, metadata)
+        return Response(data[start:end + 1], status_code=status_code, media_type="audio/midi", headers=headers)
 
     return StreamingResponse(
-        midi_stream,
+        iter_blob(metadata["content_hash"], start, end, metadata["codec"], metadata["stored_size"]),
+        status_code=status_code,
         media_type="audio/midi",
-        headers={"Content-Disposition": f"attachment; filename={metadata.file_name}.mid"}
+        headers=headers
     )
 
-@router.get('/list')
-async def get_all_midi_files(limit: int = 10, page: int = 1, db: Session = Depends(get_main_db)):
-    if limit <= 0 or page <= 0:
-        raise HTTPException(status_code=400, detail="Limit and page must be positive integers")
+@router.get("/render/{file_id}", dependencies=[Depends(rate_limit("render"))])
+async def render_midi_file(
+    file_id: str,
+    request: Request,
+    bank: Optional[str] = None,
+    sample_rate: int = 44100,
+    format: str = "wav",
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db)
+):
+    validate_uuid(file_id)
+    if bank is not None and bank not in BANKS:
+        raise HTTPException(status_code=400, detail=f"Bank must be one of: {', '.join(BANKS)}")
+    if sample_rate not in SAMPLE_RATES:
+        raise HTTPException(status_code=400, detail=f"Sample rate must be one of: {', '.join(map(str, SAMPLE_RATES))}")
+    if format not in ("wav", "pcm"):
+        raise HTTPException(status_code=400, detail="Format must be wav or pcm")
 
-    offset = (page - 1) * limit
+    metadata = await get_served_metadata(file_id, db, file_db)
 
-    # Query the main database for all MIDI metadata
-    midi_files = db.query(MidiMetadata).offset(offset).limit(limit).all()
+    # The rendering is fully determined by the content and the render options
+    etag = f'"{metadata["content_hash"]}-{bank or "auto"}-{sample_rate}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
+    try:
+        async with render_slots.hold(render_cost(metadata["file_size"])):
+            data = await load_blob(file_db, metadata)
+            audio = await run_in_process(render_midi, data, bank, sample_rate, format, settings.max_render_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if format == "pcm":
+        media_type = f"audio/L16; rate={sample_rate}; channels=1"
+    else:
+        media_type = "audio/wav"
+        headers["Content-Disposition"] = f"attachment; filename={metadata['file_name']}.wav"
+
+    return Response(audio, media_type=media_type, headers=headers)
+
+@router.post("/tab", dependencies=[Depends(rate_limit("generate"))])
+async def solve_tab_for_notes(tab_request: TabRequest, request: Request):
+    # String and fret for every note, in request order; nothing is stored
+    await charge_notes(request, len(tab_request.notes))
+    try:
+        async with encode_slots.hold(encode_cost(len(tab_request.notes))):
+            return await run_in_process(tab_for_request, tab_request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Solves in progress by (content hash, bank), so concurrent cache misses share one
+_tab_solves = {}
+
+async def _solve_tab(data: bytes, bank: Optional[str], cost: int) -> bytes:
+    async with encode_slots.hold(cost):
+        tab = await run_in_process(tab_for_midi, data, bank)
+    # Cached and served already encoded; serializing thousands of positions isn't free
+    return json.dumps(tab, separators=(",", ":")).encode()
+
+def _tab_solved(key, task):
+    _tab_solves.pop(key, None)
+    if not task.cancelled():
+        # Retrieved here in case every waiter has gone away
+        task.exception()
+
+async def solve_stored_tab(file_db: AsyncSession, metadata: dict, bank: Optional[str]) -> bytes:
+    key = (metadata["content_hash"], bank)
+    if key not in _tab_solves:
+        data = await load_blob(file_db, metadata)
+        if key not in _tab_solves:
+            # Stored MIDI takes roughly eight bytes per note
+            task = asyncio.ensure_future(_solve_tab(data, bank, encode_cost(metadata["file_size"] // 8)))
+            task.add_done_callback(partial(_tab_solved, key))
+            _tab_solves[key] = task
+    # One caller disconnecting mustn't cancel the solve for the others
+    return await asyncio.shield(_tab_solves[key])
+
+@router.get("/tab/{file_id}", dependencies=[Depends(rate_limit("tab"))])
+async def get_midi_tab(
+    file_id: str,
+    request: Request,
+    bank: Optional[str] = None,
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db)
+):
+    validate_uuid(file_id)
+    if bank is not None and bank not in BANKS:
+        raise HTTPException(status_code=400, detail=f"Bank must be one of: {', '.join(BANKS)}")
+
+    metadata = await get_served_metadata(file_id, db, file_db)
+
+    etag = f'"{metadata["content_hash"]}-tab-{bank or "auto"}"'
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # Entries remember the content they were solved for, so edits never serve stale tabs
+    cache_key = str(uuid.UUID(file_id))
+    cached = tab_cache.get(cache_key)
+    if cached is None or cached[0] != metadata["content_hash"]:
+        cached = (metadata["content_hash"], {})
+    body = cached[1].get(bank or "auto")
+
+    if body is None:
+        try:
+            body = await solve_stored_tab(file_db, metadata, bank)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Stored file is not valid MIDI")
+
+        cached[1][bank or "auto"] = body
+        tab_cache.set(cache_key, cached, size=sum(map(len, cached[1].values())))
+
+    return Response(body, media_type="application/json", headers=headers)
+
+_storage_stats = CountCache(ttl=60.0)
+
+@router.get("/storage-stats")
+async def get_storage_stats(
+    file_db: AsyncSession = Depends(get_file_db),
+    principal: Principal = Depends(get_principal)
+):
+    if principal.role != UserRole.developer.value:
+        raise HTTPException(status_code=403, detail="You do not have permission to view storage stats")
+
+    stats = _storage_stats.get("blobs")
+    if stats is None:
+        rows = (await file_db.execute(
+            select(
+                MidiBlob.codec,
+                func.count(),
+                func.coalesce(func.sum(MidiBlob.size), 0),
+                func.coalesce(func.sum(func.coalesce(MidiBlob.stored_size, MidiBlob.size)), 0)
+            ).group_by(MidiBlob.codec)
+        )).all()
+
+        # Rows without a codec haven't been read since codecs were introduced
+        by_codec = {
+            codec or "unmigrated": {"blobs": count, "raw_bytes": int(raw), "stored_bytes": int(stored)}
+            for codec, count, raw, stored in rows
+        }
+        raw_bytes = sum(entry["raw_bytes"] for entry in by_codec.values())
+        stored_bytes = sum(entry["stored_bytes"] for entry in by_codec.values())
+        stats = {
+            "blobs": sum(entry["blobs"] for entry in by_codec.values()),
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "saved_bytes": raw_bytes - stored_bytes,
+            "ratio": stored_bytes / raw_bytes if raw_bytes else 1.0,
+            "by_codec": by_codec,
+        }
+        _storage_stats.set("blobs", stats)
+
+    return stats
+
+_total_counts = CountCache(ttl=30.0)
+
+async def paginate_metadata(db: AsyncSession, query, limit: int, cursor: Optional[str]):
+    # Newest first; (created_at, id) makes the order total so pages never overlap
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(tuple_(MidiMetadata.created_at, MidiMetadata.id) < tuple_(created_at, row_id))
+
+    rows = (await db.scalars(
+        query.order_by(MidiMetadata.created_at.desc(), MidiMetadata.id.desc()).limit(limit + 1)
+    )).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return rows, next_cursor
+
+async def count_metadata(db: AsyncSession, user_id: Optional[str] = None):
+    key = user_id or "*"
+    total = _total_counts.get(key)
+    if total is not None:
+        return total
+
+    if user_id is None and db.bind.dialect.name == "postgresql":
+        # The planner's row estimate is good enough for a global total and costs nothing
+        total = await db.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"),
+            {"name": MidiMetadata.__tablename__}
+        )
+
+    if total is None or total < 0:
+        query = select(func.count()).select_from(MidiMetadata)
+        if user_id is not None:
+            query = query.where(MidiMetadata.user_id == user_id)
+        total = await db.scalar(query)
+
+    _total_counts.set(key, total)
+    return total
+
+@router.get('/list')
+async def get_all_midi_files(
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_main_db)
+):
+    validate_limit(limit)
+
+    # Query the main database for all MIDI metadata
+    midi_files, next_cursor = await paginate_metadata(db, select(MidiMetadata), limit, cursor)
+
+    response = {
+        "midi_files": [
+            {"id": midi_file.id, "file_name": midi_file.file_name, "user_id": midi_file.user_id}
+            for midi_file in midi_files
+        ],
+        "next_cursor": next_cursor,
+    }
+    if include_total:
+        response["total"] = await count_metadata(db)
     if not midi_files:
-        return {"detail": "No MIDI files found", "midi_files": []}
+        response["detail"] = "No MIDI files found"
 
-    response = [
-        {"id": midi_file.id, "file_name": midi_file.file_name, "user_id": midi_file.user_id}
-        for midi_file in midi_files
-    ]
+    return response
 
-    return {"midi_files": response}
+def user_midi_query(user_id: str):
+    return select(MidiMetadata).where(MidiMetadata.user_id == user_id)
 
 @router.get('/user-midi')
 async def get_user_midi_files(
     user_id: str,
     limit: int = 10,
-    page: int = 1,
-    db: Session = Depends(get_main_db)
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_main_db)
 ):
-    if limit <= 0 or page <= 0:
-        raise HTTPException(status_code=400, detail="Limit and page must be positive integers")
-
-    offset = (page - 1) * limit
+    validate_limit(limit)
+    validate_uuid(user_id)
 
     # Query the main database for MIDI metadata for the specified user
-    midi_files = db.query(MidiMetadata).filter(MidiMetadata.user_id == user_id).offset(offset).limit(limit).all()
-
+    midi_files, next_cursor = await paginate_metadata(db, user_midi_query(user_id), limit, cursor)
+
+    response = {
+        "midi_files": [
+            {"id": midi_file.id, "file_name": midi_file.file_name}
+            for midi_file in midi_files
+        ],
+        "next_cursor": next_cursor,
+    }
+    if include_total:
+        response["total"] = await count_metadata(db, user_id)
     if not midi_files:
-        return {"detail": "No MIDI files found for this user", "midi_files": []}
-
-    response = [
-        {"id": midi_file.id, "file_name": midi_file.file_name}
-        for midi_file in midi_files
-    ]
-
-    return {"midi_files": response}
+        response["detail"] = "No MIDI files found for this user"
+
+    return response
+
+def export_name(file_name: str, used: set) -> str:
+    base = file_name.replace("/", "_").replace("\\", "_").strip() or "untitled"
+    name, copy = f"{base}.mid", 1
+    # Compared case-insensitively so extracting on Windows or macOS doesn't overwrite
+    while name.lower() in used:
+        copy += 1
+        name = f"{base} ({copy}).mid"
+    used.add(name.lower())
+    return name
+
+async def export_page(db: AsyncSession, file_db: AsyncSession, rows: list) -> list:
+    # Served metadata for a page of rows, from one query for unflushed edits and one
+    # for blob codecs. Only legacy rows, files with unflushed edits and blobs that
+    # predate codecs go through load_served_metadata one by one
+    stale = set((await file_db.scalars(
+        select(MidiNoteState.file_id).where(
+            MidiNoteState.file_id.in_([row.file_id for row in rows]),
+            MidiNoteState.encoded_version < MidiNoteState.version
+        )
+    )).all())
+    encodings = {
+        blob_hash: (codec, stored_size)
+        for blob_hash, codec, stored_size in (await file_db.execute(
+            select(MidiBlob.hash, MidiBlob.codec, MidiBlob.stored_size)
+            .where(MidiBlob.hash.in_([row.content_hash for row in rows if row.content_hash is not None]))
+        )).all()
+    }
+
+    page = []
+    for row in rows:
+        codec, stored_size = encodings.get(row.content_hash, (None, None))
+        if codec is not None and row.file_id not in stale:
+            page.append(served_fields(row, codec, stored_size))
+            continue
+        try:
+            page.append(await load_served_metadata(str(row.id), db, file_db))
+        except HTTPException:
+            # Deleted since the page was read, or its blob is missing
+            continue
+    return page
+
+async def export_entries(user_id: str):
+    # Each page is resolved with short-lived sessions, so no connection is held while
+    # the client downloads. The cache is bypassed so one export doesn't evict every
+    # other hot entry
+    used = set()
+    cursor = None
+    while True:
+        async with SessionLocal() as db, FileSessionLocal() as file_db:
+            rows, cursor = await paginate_metadata(db, user_midi_query(user_id), settings.import_batch_size, cursor)
+            # Detached, so commits made while flushing edits can't expire them
+            db.expunge_all()
+            page = await export_page(db, file_db, rows)
+
+        for metadata in page:
+            chunks = iter_blob(
+                metadata["content_hash"], 0, metadata["file_size"] - 1, metadata["codec"], metadata["stored_size"]
+            )
+            yield export_name(metadata["file_name"], used), metadata["last_modified"], chunks
+        if cursor is None:
+            return
+
+@router.get("/export", dependencies=[Depends(rate_limit("bulk"))])
+async def export_midi_files(user_id: str = Depends(get_current_user_id)):
+    return StreamingResponse(
+        stream_zip(export_entries(user_id)),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=midi-library.zip"}
+    )
 
-@router.delete("/delete/{file_id}", dependencies=[Depends(JWTBearer())])
+SEARCH_SORTS = {
+    "created_at": MidiMetadata.created_at,
+    "duration": MidiMetadata.duration,
+    "note_count": MidiMetadata.note_count,
+    "tempo": MidiMetadata.tempo,
+}
+
+def bank_filter(bank: str):
+    # Same General MIDI ranges bank_for_program uses; everything else plays as acoustic
+    if bank == "bass":
+        return MidiMetadata.program.between(32, 39)
+    if bank == "electric":
+        return MidiMetadata.program.between(26, 31)
+    return ~MidiMetadata.program.between(26, 39)
+
+@router.get('/search')
+async def search_midi_files(
+    key: Optional[str] = None,
+    bank: Optional[str] = None,
+    program: Optional[int] = None,
+    min_duration: Optional[float] = None,
+    max_duration: Optional[float] = None,
+    min_tempo: Optional[float] = None,
+    max_tempo: Optional[float] = None,
+    min_notes: Optional[int] = None,
+    max_notes: Optional[int] = None,
+    min_pitch: Optional[int] = None,
+    max_pitch: Optional[int] = None,
+    user_id: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_main_db)
+):
+    validate_limit(limit)
+    if sort not in SEARCH_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SEARCH_SORTS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+
+    # Filters only touch the summary columns written with each file
+    conditions = []
+    if key is not None:
+        key_name = normalize_key_name(key)
+        if key_name is None:
+            raise HTTPException(status_code=400, detail="key must look like 'E minor' or 'F# major'")
+        conditions.append(MidiMetadata.musical_key == key_name)
+    if bank is not None:
+        if bank not in BANKS:
+            raise HTTPException(status_code=400, detail=f"bank must be one of {', '.join(BANKS)}")
+        conditions.append(bank_filter(bank))
+    if program is not None:
+        conditions.append(MidiMetadata.program == program)
+    if min_duration is not None:
+        conditions.append(MidiMetadata.duration >= min_duration)
+    if max_duration is not None:
+        conditions.append(MidiMetadata.duration <= max_duration)
+    if min_tempo is not None:
+        conditions.append(MidiMetadata.tempo >= min_tempo)
+    if max_tempo is not None:
+        conditions.append(MidiMetadata.tempo <= max_tempo)
+    if min_notes is not None:
+        conditions.append(MidiMetadata.note_count >= min_notes)
+    if max_notes is not None:
+        conditions.append(MidiMetadata.note_count <= max_notes)
+    if min_pitch is not None:
+        conditions.append(MidiMetadata.pitch_min >= min_pitch)
+    if max_pitch is not None:
+        conditions.append(MidiMetadata.pitch_max <= max_pitch)
+    if user_id is not None:
+        validate_uuid(user_id)
+        conditions.append(MidiMetadata.user_id == user_id)
+
+    column = SEARCH_SORTS[sort]
+    # Rows without a summary have nothing to sort on
+    conditions.append(column.isnot(None))
+    if cursor:
+        value, row_id = decode_search_cursor(cursor, sort)
+        position = tuple_(column, MidiMetadata.id)
+        conditions.append(position < tuple_(value, row_id) if order == "desc" else position > tuple_(value, row_id))
+
+    ordering = (column.desc(), MidiMetadata.id.desc()) if order == "desc" else (column.asc(), MidiMetadata.id.asc())
+    rows = (await db.scalars(select(MidiMetadata).where(*conditions).order_by(*ordering).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(sort, getattr(rows[-1], sort), rows[-1].id)
+
+    response = {
+        "midi_files": [
+            {
+                "id": midi_file.id,
+                "file_name": midi_file.file_name,
+                "user_id": midi_file.user_id,
+                **{field: getattr(midi_file, field) for field in SUMMARY_FIELDS},
+            }
+            for midi_file in rows
+        ],
+        "next_cursor": next_cursor,
+    }
+    if not rows:
+        response["detail"] = "No MIDI files match the search"
+
+    return response
+
+@router.delete("/delete/{file_id}")
 async def delete_midi_file(
     file_id: str,
-    db: Session = Depends(get_main_db),
-    file_db: Session = Depends(get_file_db),
-    user_id: str = Depends(get_current_user_id)
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db),
+    principal: Principal = Depends(get_principal)
 ):
     validate_uuid(file_id)
 
-    metadata = db.query(MidiMetadata).filter(MidiMetadata.file_id == file_id).first()
+    metadata = await db.scalar(select(MidiMetadata).where(MidiMetadata.file_id == file_id))
     if not metadata:
         raise HTTPException(status_code=404, detail="MIDI metadata not found")
 
     # Get the user who owns the file
     owner_id = metadata.user_id
 
-    # Get the current user's role
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     # Check if the user is the owner or an admin
-    if user_id != owner_id and user.role != UserRole.developer:
+    if principal.user_id != owner_id and principal.role != UserRole.developer.value:
         raise HTTPException(status_code=403, detail="You do not have permission to delete this file")
 
-    midi_file = file_db.query(MidiFile).filter(MidiFile.id == file_id).first()
+    midi_file = await file_db.scalar(select(MidiFile).where(MidiFile.id == file_id))
     if not midi_file:
         raise HTTPException(status_code=404, detail="MIDI file not found in file database")
 
-    file_db.delete(midi_file)
-    file_db.commit()
+    await delete_files(file_db, [midi_file.id])
+    await file_db.commit()
 
-    db.delete(metadata)
-    db.commit()
+    await db.delete(metadata)
+    await db.commit()
+    await invalidation_bus.invalidate([metadata.id])
 
     return {"detail": "MIDI file and metadata deleted successfully"}
 
-@router.patch("/update/{file_id}", dependencies=[Depends(JWTBearer())])
+@router.get("/notes/{file_id}")
+async def get_midi_notes(
+    file_id: str,
+    file_db: AsyncSession = Depends(get_file_db)
+):
+    validate_uuid(file_id)
+
+    midi_file = await file_db.scalar(select(MidiFile).where(MidiFile.id == file_id))
+    if not midi_file:
+        raise HTTPException(status_code=404, detail="MIDI file not found in file database")
+
+    try:
+        version, program, notes = await load_notes(file_db, midi_file)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Stored file is not valid MIDI")
+
+    # Columns rather than one object per note; ids are what edit ops refer to
+    return {
+        "version": version,
+        "program": program,
+        "ids": notes.ids.tolist(),
+        "pitches": notes.pitches.tolist(),
+        "times": notes.starts.tolist(),
+        "durations": (notes.ends - notes.starts).tolist(),
+        "velocities": (notes.velocities / 127).tolist(),
+    }
+
+@router.patch("/update/{file_id}")
 async def update_midi_file(
     file_id: str,
     update_data: UpdateMidiRequest,
-    db: Session = Depends(get_main_db),
-    file_db: Session = Depends(get_file_db),
+    db: AsyncSession = Depends(get_main_db),
+    file_db: AsyncSession = Depends(get_file_db),
     user_id: str = Depends(get_current_user_id)
 ):
     validate_uuid(file_id)
+    if update_data.ops is not None and update_data.file_data:
+        raise HTTPException(status_code=400, detail="Send either file_data or ops, not both")
+    if update_data.ops is not None and update_data.version is None:
+        raise HTTPException(status_code=400, detail="ops need the version they were made against")
 
-    metadata = db.query(MidiMetadata).filter(MidiMetadata.file_id == file_id).first()
+    metadata = await db.scalar(select(MidiMetadata).where(MidiMetadata.file_id == file_id))
     if not metadata:
         raise HTTPException(status_code=404, detail="MIDI metadata not found")
 
@@ -211,7 +920,7 @@ async def update_midi_file(
         raise HTTPException(status_code=403, detail="You do not have permission to update this file")
 
     # Get the file from the file database
-    midi_file = file_db.query(MidiFile).filter(MidiFile.id == file_id).first()
+    midi_file = await file_db.scalar(select(MidiFile).where(MidiFile.id == file_id))
     if not midi_file:
         raise HTTPException(status_code=404, detail="MIDI file not found in file database")
 
@@ -220,11 +929,34 @@ async def update_midi_file(
         midi_file.file_name = update_data.file_name
         metadata.file_name = update_data.file_name  # Propagate the change to the metadata
 
-    # Update the file_data if provided
-    if update_data.file_data:
-        midi_file.file_data = update_data.file_data
+    response = {"detail": "MIDI file and metadata updated successfully"}
 
-    file_db.commit()
-    db.commit()
-
-    return {"detail": "MIDI file and metadata updated successfully"}
\ No newline at end of file
+    try:
+        # Update the file_data if provided; identical content only adds a blob reference
+        if update_data.file_data:
+            response["version"] = await reset_notes(file_db, midi_file.id, update_data.file_data, update_data.version)
+            metadata.content_hash = await replace_file_data(file_db, midi_file, update_data.file_data)
+            metadata.file_size = len(update_data.file_data)
+            # Uploads aren't required to be valid MIDI; those just drop out of /midi/search
+            try:
+                summary = await run_in_process(summarize_midi, update_data.file_data)
+            except ValueError:
+                summary = UNREADABLE_SUMMARY
+            for field, value in summary.items():
+                setattr(metadata, field, value)
+
+        # Note edits only append to the edit log; the blob catches up on the next read
+        if update_data.ops is not None:
+            response["version"], response["inserted_ids"] = await apply_edits(
+                file_db, midi_file, update_data.version, update_data.ops
+            )
+    except EditConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await file_db.commit()
+    await db.commit()
+    await invalidation_bus.invalidate([metadata.id])
+
+    return response
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import AfterValidator, BaseModel, EmailStr, Field, FiniteFloat
+from typing import Annotated, Optional, List, Literal
 from enum import Enum
+from utils.config import settings
 
 class UserRole(str, Enum):
     developer = "developer"
@@ -26,15 +27,41 @@ class PostUser(BaseModel):
 
 class NoteEvent(BaseModel):
     note: str
-    time: float
-    duration: float
-    velocity: float = 0.8
+    time: FiniteFloat
+    duration: FiniteFloat
+    velocity: float = Field(0.8, ge=0.0, le=1.0)
+
+def limit_notes(notes: List[NoteEvent]) -> List[NoteEvent]:
+    # A validator rather than Field(max_length=...), which would read the settings
+    # when this module is imported
+    if len(notes) > settings.max_notes_per_request:
+        raise ValueError(f"At most {settings.max_notes_per_request} notes can be sent at once")
+    return notes
+
+NoteList = Annotated[List[NoteEvent], AfterValidator(limit_notes)]
 
 class MidiRequest(BaseModel):
     name: str
     instrument_name: str
-    notes: List[NoteEvent]
+    notes: NoteList
+
+class TabRequest(BaseModel):
+    bank: Literal["acoustic", "electric", "bass"] = "acoustic"
+    notes: NoteList
+
+class NoteOp(BaseModel):
+    op: Literal["insert", "delete", "move", "velocity"]
+    id: Optional[int] = None
+    note: Optional[str] = None
+    pitch: Optional[int] = None
+    time: Optional[float] = None
+    duration: Optional[float] = None
+    velocity: Optional[float] = None
 
 class UpdateMidiRequest(BaseModel):
     file_name: Optional[str] = None
-    file_data: Optional[bytes] = None
\ No newline at end of file
+    file_data: Optional[bytes] = None
+    # Note-level edits against the note array from /midi/notes; version is the one
+    # they were made against and must still be current
+    ops: Optional[List[NoteOp]] = None
+    version: Optional[int] = None
\ No newline at end of file
@@ -0,0 +1,196 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, Request, status
+from .auth import decodeJWT
+from .cache import load_backend
+from .config import settings
+from .metrics import Counter
+
+admission_rejections = Counter("admission_rejections_total", "Requests turned away by admission control", ("policy", "reason"))
+
+class LocalRateLimitBackend:
+    # Token buckets in this process's memory, so every worker enforces its limits on
+    # its own. A shared backend (Redis, say) implements the same two methods and is
+    # configured through settings.rate_limit_backend
+    def __init__(self, max_keys: int = None):
+        self.max_keys = max_keys or settings.rate_limit_max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        # Returns 0 when admitted, otherwise the seconds until `cost` tokens are available
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        # Costs above the burst could never be paid, so they empty a full bucket instead
+        cost = min(cost, burst)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / rate
+
+        # Least recently used buckets go first; a dropped bucket comes back full
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def close(self):
+        pass
+
+_rate_limits = None
+
+def get_rate_limits():
+    # Loaded on first use so importing this module doesn't read the settings
+    global _rate_limits
+    if _rate_limits is None:
+        _rate_limits = load_backend(settings.rate_limit_backend) or LocalRateLimitBackend()
+    return _rate_limits
+
+async def close_rate_limits():
+    if _rate_limits is not None:
+        await _rate_limits.close()
+
+def client_ip(request: Request) -> str:
+    # Behind the proxy this relies on uvicorn's --proxy-headers
+    return request.client.host if request.client else "unknown"
+
+def token_subject(request: Request):
+    payload = getattr(request.state, "token_payload", None)
+    if payload is None:
+        header = request.headers.get("authorization", "")
+        if not header.startswith("Bearer "):
+            return None
+        payload = decodeJWT(header[7:])
+        if not payload:
+            return None
+        # get_principal reuses it instead of decoding the token again
+        request.state.token_payload = payload
+    return payload.get("sub")
+
+async def enforce(request: Request, policy: str, rate: float, burst: float, cost: float = 1.0, per_ip: bool = True):
+    # Charges the caller's per-user bucket and their IP's bucket, which is ip_rate_factor
+    # times larger because one address can front many users
+    if not settings.rate_limit_enabled:
+        return
+
+    buckets = []
+    subject = token_subject(request)
+    if subject:
+        buckets.append((f"{policy}:user:{subject}", rate, burst))
+    if per_ip or not subject:
+        factor = settings.ip_rate_factor
+        buckets.append((f"{policy}:ip:{client_ip(request)}", rate * factor, burst * factor))
+
+    for key, key_rate, key_burst in buckets:
+        retry_after = await get_rate_limits().take(key, key_rate, key_burst, cost)
+        if retry_after > 0:
+            admission_rejections.labels(policy, "rate").inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please slow down",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+async def enforce_subject(policy: str, subject) -> float:
+    # For work that doesn't arrive as a request, such as WebSocket messages: charges
+    # the subject's bucket and returns 0 when admitted, otherwise the seconds to wait
+    if not settings.rate_limit_enabled:
+        return 0.0
+    retry_after = await get_rate_limits().take(
+        f"{policy}:user:{subject}", getattr(settings, f"{policy}_rate"), getattr(settings, f"{policy}_burst")
+    )
+    if retry_after > 0:
+        admission_rejections.labels(policy, "rate").inc()
+    return retry_after
+
+def rate_limit(policy: str):
+    # Route dependency; `policy` names the <policy>_rate and <policy>_burst settings.
+    # Runs before the body is validated and before the principal is loaded
+    async def dependency(request: Request):
+        await enforce(request, policy, getattr(settings, f"{policy}_rate"), getattr(settings, f"{policy}_burst"))
+    return dependency
+
+async def charge_notes(request: Request, count: int):
+    # Note volume per user, so a few huge uploads count like many small ones
+    await enforce(request, "notes", settings.notes_rate, settings.notes_burst, cost=count, per_ip=False)
+
+class WeightedSemaphore:
+    # Admits work while the summed cost in flight fits the <name>_capacity setting,
+    # first come first served. Callers wait at most admission_queue_timeout, and only
+    # while fewer than admission_max_waiters are queued, before getting a 503
+    def __init__(self, name: str):
+        self.name = name
+        self.in_use = 0
+        self._waiters = deque()
+
+    @property
+    def capacity(self) -> int:
+        return getattr(settings, f"{self.name}_capacity")
+
+    def _reject(self):
+        admission_rejections.labels(self.name, "busy").inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": str(math.ceil(settings.admission_queue_timeout))}
+        )
+
+    def _wake(self):
+        while self._waiters and self.in_use + self._waiters[0][0] <= self.capacity:
+            cost, future = self._waiters.popleft()
+            self.in_use += cost
+            future.set_result(None)
+
+    def _release(self, cost: int):
+        self.in_use -= cost
+        self._wake()
+
+    async def _acquire(self, cost: int):
+        if not self._waiters and self.in_use + cost <= self.capacity:
+            self.in_use += cost
+            return
+        if len(self._waiters) >= settings.admission_max_waiters:
+            self._reject()
+
+        waiter = (cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], settings.admission_queue_timeout)
+        except BaseException as e:
+            if waiter[1].done() and not waiter[1].cancelled():
+                # Granted just as the wait gave up
+                self._release(cost)
+            else:
+                self._waiters.remove(waiter)
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject()
+            raise
+
+    @asynccontextmanager
+    async def hold(self, cost: int):
+        # Work larger than the whole capacity still runs, just alone
+        cost = max(1, min(cost, self.capacity))
+        await self._acquire(cost)
+        try:
+            yield
+        finally:
+            self._release(cost)
+
+# Process pool work is limited per worker, since that's where the CPU time goes
+encode_slots = WeightedSemaphore("encode")
+render_slots = WeightedSemaphore("render")
+
+def encode_cost(notes: int) -> int:
+    return 1 + notes // 1000
+
+def render_cost(file_size: int) -> int:
+    return 1 + (file_size or 0) // (64 * 1024)
+
+def decode_cost(file_size: int) -> int:
+    # Parsing stored MIDI, which takes roughly eight bytes per note
+    return encode_cost((file_size or 0) // 8)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+from functools import lru_cache
+from typing import Optional
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+KEY_TONICS = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+KEY_MODES = ("major", "minor")
+
+# Krumhansl-Kessler probe-tone profiles, tonic first
+MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    return (values - values.mean(axis=-1, keepdims=True)) / values.std(axis=-1, keepdims=True)
+
+@lru_cache(maxsize=None)
+def key_templates() -> np.ndarray:
+    # One row per key (12 major, then 12 minor), standardized so a dot product is a correlation
+    return _standardize(np.array(
+        [np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)]
+        + [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)]
+    ))
+
+KEY_NAMES = tuple(f"{tonic} {mode}" for mode in KEY_MODES for tonic in KEY_TONICS)
+
+SUMMARY_FIELDS = ("duration", "note_count", "pitch_min", "pitch_max", "program", "tempo", "musical_key")
+# Stored for files that can't be parsed; the zero note count marks them as already tried
+UNREADABLE_SUMMARY = {**dict.fromkeys(SUMMARY_FIELDS), "note_count": 0}
+
+def normalize_key_name(name: str) -> Optional[str]:
+    # "e minor", "Fs major" and "F# Major" all map onto the stored spelling
+    parts = name.strip().split()
+    if len(parts) != 2:
+        return None
+    tonic = parts[0][:1].upper() + parts[0][1:].replace("s", "#")
+    key = f"{tonic} {parts[1].lower()}"
+    return key if key in KEY_NAMES else None
+
+def estimate_key(pitches, starts, ends) -> Optional[str]:
+    # Krumhansl-Schmuckler: correlate the duration-weighted pitch-class histogram
+    # with every key profile and keep the best match
+    pitches = np.asarray(pitches, dtype=np.int64)
+    if not len(pitches):
+        return None
+
+    durations = np.maximum(np.asarray(ends, dtype=np.float64) - np.asarray(starts, dtype=np.float64), 0.0)
+    if not durations.any():
+        durations = np.ones(len(pitches))
+    histogram = np.bincount(pitches % 12, weights=durations, minlength=12)
+    if histogram.std() == 0:
+        return None
+
+    return KEY_NAMES[int(np.argmax(key_templates() @ _standardize(histogram)))]
+
+def summarize_notes(pitches, starts, ends, program: int, tempo: float) -> dict:
+    # Searchable columns of MidiMetadata, computed once when a file is written
+    pitches = np.asarray(pitches, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.float64)
+    count = len(pitches)
+    return {
+        "duration": float(ends.max()) if count else 0.0,
+        "note_count": count,
+        "pitch_min": int(pitches.min()) if count else None,
+        "pitch_max": int(pitches.max()) if count else None,
+        "program": int(program),
+        "tempo": float(tempo),
+        "musical_key": estimate_key(pitches, starts, ends),
+    }
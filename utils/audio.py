@@ -0,0 +1,169 @@
+from __future__ import annotations
+import io
+import wave
+from functools import lru_cache
+from pathlib import Path
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+SAMPLE_ROOT = Path(__file__).resolve().parent.parent / "public"
+
+# Sample bank name -> directory under public/
+BANKS = {
+    "acoustic": "guitar-acoustic",
+    "electric": "guitar-electric",
+    "bass": "guitar-bass",
+}
+
+SEMITONES = {"C": 0, "Cs": 1, "D": 2, "Ds": 3, "E": 4, "F": 5, "Fs": 6, "G": 7, "Gs": 8, "A": 9, "As": 10, "B": 11}
+
+SAMPLE_RATES = (22050, 44100)
+# Samples are cut to this length when decoded; notes never ring longer than this
+MAX_SAMPLE_SECONDS = 4.0
+RELEASE_SECONDS = 0.08
+
+def bank_for_program(program: int) -> str:
+    # General MIDI: 24-25 acoustic guitars, 26-31 electric guitars, 32-39 basses
+    if 32 <= program <= 39:
+        return "bass"
+    if 26 <= program <= 31:
+        return "electric"
+    return "acoustic"
+
+def sample_name_to_number(name: str) -> int:
+    # "Cs3" -> 49; the banks spell sharps with an "s"
+    return 12 * (int(name[-1]) + 1) + SEMITONES[name[:-1]]
+
+@lru_cache(maxsize=None)
+def load_bank(bank: str, sample_rate: int = 44100):
+    # Decodes every sample of a bank once per process; returns (pitches, samples)
+    # with samples as int16 to halve the resident size
+    import miniaudio
+
+    sampled = []
+    for path in sorted((SAMPLE_ROOT / BANKS[bank]).glob("*.mp3")):
+        decoded = miniaudio.decode_file(
+            str(path),
+            output_format=miniaudio.SampleFormat.SIGNED16,
+            nchannels=1,
+            sample_rate=sample_rate
+        )
+        samples = np.frombuffer(decoded.samples, dtype=np.int16)[:int(MAX_SAMPLE_SECONDS * sample_rate)]
+        sampled.append((sample_name_to_number(path.stem), samples))
+
+    sampled.sort(key=lambda item: item[0])
+    return np.array([pitch for pitch, _ in sampled]), [samples for _, samples in sampled]
+
+@lru_cache(maxsize=None)
+def nearest_samples(bank: str, sample_rate: int = 44100):
+    # For every MIDI pitch: index of the closest sampled note and the playback rate
+    # needed to shift it, so sparse banks still cover the whole range
+    pitches, _ = load_bank(bank, sample_rate)
+    all_pitches = np.arange(128)
+    nearest = np.abs(all_pitches[:, None] - pitches[None, :]).argmin(axis=1)
+    rates = 2.0 ** ((all_pitches - pitches[nearest]) / 12.0)
+    return nearest, rates
+
+@lru_cache(maxsize=None)
+def pitched_bank(bank: str, sample_rate: int = 44100) -> list:
+    # One slot per MIDI pitch, filled the first time the pitch is played. Each bank
+    # has its own, so playing one bank never evicts another's notes
+    return [None] * 128
+
+def pitched_sample(bank: str, pitch: int, sample_rate: int = 44100) -> np.ndarray:
+    table = pitched_bank(bank, sample_rate)
+    if table[pitch] is None:
+        table[pitch] = _pitch_shift(bank, pitch, sample_rate)
+    return table[pitch]
+
+def preload_bank(bank: str, sample_rate: int = 44100):
+    # Resamples every pitch between the lowest and highest sampled note, where nearly
+    # all notes fall, so live playback doesn't have to
+    pitches, _ = load_bank(bank, sample_rate)
+    for pitch in range(int(pitches.min()), int(pitches.max()) + 1):
+        pitched_sample(bank, pitch, sample_rate)
+
+def _pitch_shift(bank: str, pitch: int, sample_rate: int) -> np.ndarray:
+    _, samples = load_bank(bank, sample_rate)
+    nearest, rates = nearest_samples(bank, sample_rate)
+    source = samples[nearest[pitch]].astype(np.float32) / 32768.0
+    rate = rates[pitch]
+    if rate == 1.0:
+        return source
+
+    # Resample by linear interpolation; playing faster raises the pitch
+    positions = np.arange(0, len(source) - 1, rate)
+    return np.interp(positions, np.arange(len(source)), source).astype(np.float32)
+
+def render_notes(pitches, starts, ends, velocities, bank: str, sample_rate: int = 44100) -> np.ndarray:
+    pitches = np.asarray(pitches, dtype=np.int64)
+    starts = np.maximum(np.asarray(starts, dtype=np.float64), 0.0)
+    ends = np.maximum(np.asarray(ends, dtype=np.float64), starts)
+    gains = np.asarray(velocities, dtype=np.float32) / 127.0
+
+    release = int(RELEASE_SECONDS * sample_rate)
+    start_frames = np.rint(starts * sample_rate).astype(np.int64)
+    # Each note sounds until its end plus the release tail, capped by the sample length
+    held_frames = np.rint((ends - starts) * sample_rate).astype(np.int64) + release
+    held_frames = np.minimum(held_frames, int(MAX_SAMPLE_SECONDS * sample_rate))
+
+    # One pitched sample per distinct pitch; everything per note is worked out up front
+    used, which = np.unique(pitches, return_inverse=True)
+    samples = [pitched_sample(bank, int(pitch), sample_rate) for pitch in used]
+    sample_lengths = np.array([len(sample) for sample in samples], dtype=np.int64)
+    lengths = np.minimum(held_frames, sample_lengths[which])
+    tails = np.minimum(lengths, release)
+    sounding = np.flatnonzero(lengths > 0)
+
+    total = int((start_frames + held_frames).max()) if len(pitches) else 0
+    output = np.zeros(total, dtype=np.float32)
+    # Linear fade over the last `release` frames of a note, precomputed once
+    fade = np.linspace(1.0, 0.0, release, dtype=np.float32)
+
+    # As in BlockMixer, each note is scaled into one reused buffer and added to the
+    # output in place. Mixing every frame at once through index arrays measured
+    # several times slower, since the work is per frame rather than per note
+    scratch = np.empty(int(lengths.max()) if sounding.size else 0, dtype=np.float32)
+    for index, start, length, tail, gain in zip(
+        which[sounding].tolist(), start_frames[sounding].tolist(), lengths[sounding].tolist(),
+        tails[sounding].tolist(), gains[sounding].tolist()
+    ):
+        segment = scratch[:length]
+        np.multiply(samples[index][:length], gain, out=segment)
+        faded = segment[length - tail:]
+        np.multiply(faded, fade[release - tail:], out=faded)
+        mixed = output[start:start + length]
+        np.add(mixed, segment, out=mixed)
+
+    # Keep dense chords from clipping
+    peak = np.abs(output).max() if total else 0.0
+    if peak > 1.0:
+        output /= peak
+
+    return output
+
+def to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+def to_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(to_pcm16(samples))
+    return buffer.getvalue()
+
+def render_midi(data: bytes, bank: str = None, sample_rate: int = 44100, audio_format: str = "wav", max_seconds: float = None) -> bytes:
+    # Decode + render + encode; top-level so it can run in a worker process
+    from .smf import decode_midi
+
+    pitches, starts, ends, velocities, program = decode_midi(data)
+    if max_seconds is not None and len(ends) and ends.max() > max_seconds:
+        raise ValueError(f"MIDI file is longer than {max_seconds:g} seconds")
+
+    samples = render_notes(pitches, starts, ends, velocities, bank or bank_for_program(program), sample_rate)
+    if audio_format == "pcm":
+        return to_pcm16(samples)
+    return to_wav(samples, sample_rate)
@@ -1,18 +1,27 @@
 import jwt
-from fastapi import HTTPException, Request
+import uuid
+from dataclasses import dataclass
+from fastapi import Depends, HTTPException, Request
 from datetime import datetime, timedelta, timezone
 from typing import Union, Any, Optional
 from fastapi.security import HTTPBearer
 from jose import jwt, JWTError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db import get_main_db
+from db.models import User
+from .cache import LRUCache, invalidation_bus
 from .config import settings
 
-def create_access_token(subject: Union[str, Any], role: str, expires_delta: int = None):
+def create_access_token(subject: Union[str, Any], role: str, expires_delta: int = None, user_id: Any = None):
     if expires_delta is not None:
         expires_delta = datetime.now(tz=timezone.utc) + expires_delta
     else:
         expires_delta = datetime.now(tz=timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode = {"exp": expires_delta, "sub": str(subject), "role": role}
+    if user_id is not None:
+        to_encode["uid"] = str(user_id)
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, settings.algorithm)
     return encoded_jwt
 
@@ -55,6 +64,8 @@ class JWTBearer(HTTPBearer):
         if self.allowed_roles and user_role not in self.allowed_roles:
             raise HTTPException(status_code=403, detail="Access forbidden: insufficient permissions")
 
+        # Kept for get_principal so the token is only decoded once per request
+        request.state.token_payload = payload
         return token
 
     def verify_jwt(self, jwtoken: str) -> bool:
@@ -64,4 +75,49 @@ class JWTBearer(HTTPBearer):
         except jwt.ExpiredSignatureError:
             return False
         except jwt.JWTError:
-            return False
\ No newline at end of file
+            return False
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: uuid.UUID
+    email: str
+    username: Optional[str]
+    role: str
+
+# Resolved principals, keyed by user id (or email for tokens issued without a uid claim)
+principal_cache = LRUCache(max_bytes=lambda: settings.principal_cache_size, ttl=lambda: settings.principal_cache_ttl)
+invalidation_bus.register(principal_cache)
+
+def principal_cache_keys(user_id, email: str) -> list:
+    return [f"principal:{user_id}", f"principal:{email}"]
+
+async def resolve_principal(payload: dict, db: AsyncSession) -> Optional[Principal]:
+    user_id = payload.get("uid")
+    key = f"principal:{user_id or payload.get('sub')}"
+    principal = principal_cache.get(key)
+    if principal is not None:
+        return principal
+
+    # Confirms the user still exists; afterwards the cache answers until the TTL
+    # expires or the user is deleted
+    if user_id:
+        user = await db.scalar(select(User).where(User.id == user_id))
+    else:
+        user = await db.scalar(select(User).where(User.email == payload.get("sub")))
+    if not user:
+        return None
+
+    principal = Principal(user_id=user.id, email=user.email, username=user.username, role=user.role.value)
+    principal_cache.set(key, principal)
+    return principal
+
+async def get_principal(request: Request, token: str = Depends(JWTBearer()), db: AsyncSession = Depends(get_main_db)) -> Principal:
+    payload = getattr(request.state, "token_payload", None) or decodeJWT(token)
+    if not payload or "sub" not in payload:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    principal = await resolve_principal(payload, db)
+    if not principal:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return principal
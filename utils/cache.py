@@ -0,0 +1,138 @@
+import importlib
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+from .config import settings
+
+class LRUCache:
+    # Evicts least recently used entries once the summed entry sizes exceed max_bytes.
+    # Either limit may be a callable, read on the first set, so module-level caches
+    # don't load the settings at import
+    def __init__(self, max_bytes, ttl):
+        self._limits = (max_bytes, ttl)
+        self.max_bytes = None
+        self.ttl = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, size, expires_at = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, size: int = 1):
+        if self.max_bytes is None:
+            self.max_bytes, self.ttl = (limit() if callable(limit) else limit for limit in self._limits)
+        if size > self.max_bytes:
+            return
+
+        self._remove(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+class InMemoryInvalidationBackend:
+    # Stand-in for a shared pub/sub channel; every instance in the process sees every message
+    _subscribers = []
+
+    async def publish(self, message: dict):
+        for handler in list(self._subscribers):
+            handler(message)
+
+    async def subscribe(self, handler):
+        self._subscribers.append(handler)
+
+    async def close(self):
+        self._subscribers.clear()
+
+class InvalidationBus:
+    # Invalidates keys locally and, with a backend configured, in every other worker.
+    # Without one given, start() loads settings.cache_invalidation_backend
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self.caches = []
+
+    def register(self, cache: LRUCache):
+        self.caches.append(cache)
+
+    async def invalidate(self, keys):
+        keys = [str(key) for key in keys]
+        self._invalidate_local(keys)
+        if self.backend is not None and keys:
+            await self.backend.publish({"origin": self.origin, "keys": keys})
+
+    async def start(self):
+        if self.backend is None:
+            self.backend = load_backend(settings.cache_invalidation_backend)
+        if self.backend is not None:
+            await self.backend.subscribe(self._on_message)
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    def _on_message(self, message: dict):
+        if message.get("origin") != self.origin:
+            self._invalidate_local(message.get("keys", []))
+
+    def _invalidate_local(self, keys):
+        for cache in self.caches:
+            for key in keys:
+                cache.invalidate(key)
+
+def load_backend(path: Optional[str]):
+    if not path:
+        return None
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+# Metadata entries are keyed by metadata id; blobs by content hash, which never goes stale
+metadata_cache = LRUCache(max_bytes=lambda: settings.cache_max_bytes // 16, ttl=lambda: settings.cache_ttl_seconds)
+blob_cache = LRUCache(max_bytes=lambda: settings.cache_max_bytes, ttl=lambda: settings.cache_ttl_seconds)
+# Tablature by metadata id, together with the content hash it was solved for
+tab_cache = LRUCache(max_bytes=lambda: settings.tab_cache_max_bytes, ttl=lambda: settings.cache_ttl_seconds)
+
+invalidation_bus = InvalidationBus()
+invalidation_bus.register(metadata_cache)
+invalidation_bus.register(tab_cache)
@@ -0,0 +1,39 @@
+import lzma
+import zlib
+from .config import settings
+
+IDENTITY = "identity"
+ZLIB = "zlib"
+LZMA = "lzma"
+
+# Stored codecs that are also HTTP content codings; HTTP's "deflate" is the zlib format
+HTTP_ENCODINGS = {ZLIB: "deflate"}
+
+def compress(data: bytes):
+    # Returns (codec, payload). Tiny files aren't worth the header, large ones get
+    # lzma's better ratio; the raw bytes are kept whenever compression doesn't help
+    if len(data) < settings.compress_min_bytes:
+        return IDENTITY, data
+    if len(data) >= settings.lzma_min_bytes:
+        codec, payload = LZMA, lzma.compress(data, preset=settings.lzma_preset)
+    else:
+        codec, payload = ZLIB, zlib.compress(data, settings.zlib_level)
+    if len(payload) >= len(data):
+        return IDENTITY, data
+    return codec, payload
+
+def decompress(codec, payload: bytes) -> bytes:
+    # codec is None for rows stored before codecs existed; those are raw
+    if codec == ZLIB:
+        return zlib.decompress(payload)
+    if codec == LZMA:
+        return lzma.decompress(payload)
+    return bytes(payload)
+
+def decompressor(codec):
+    # Incremental decoder with a decompress(chunk) method, or None for raw rows
+    if codec == ZLIB:
+        return zlib.decompressobj()
+    if codec == LZMA:
+        return lzma.LZMADecompressor()
+    return None
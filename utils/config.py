@@ -1,5 +1,7 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Optional
 
 class Settings(BaseSettings):
     main_db_url: str
@@ -11,8 +13,130 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     REFRESH_TOKEN_EXPIRE_MINUTES: int
 
+    # Connection pool settings, applied to both the main and the file database
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 15000
+
+    # Password hashing
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    password_hash_queue_limit: int = 32
+
+    # MIDI encoding; 0 workers means one per CPU core
+    encode_workers: int = 0
+    max_batch_size: int = 50
+    max_packed_notes: int = 500000
+    # Longest MIDI file /midi/render will turn into audio
+    max_render_seconds: float = 600.0
+
+    # Live WebSocket renderer
+    live_block_size: int = 512
+    live_lead_blocks: int = 4
+    live_max_voices: int = 64
+    live_queue_size: int = 256
+    live_stats_interval: float = 2.0
+
+    # Jam sessions
+    jam_max_participants: int = 16
+    jam_outbox_size: int = 256
+    jam_max_recorded_notes: int = 100000
+    # Jam notes may start at most this far ahead of arrival and last at most this long
+    jam_max_note_seconds: float = 60.0
+    # Flushes store a file, so each participant gets their own token bucket for them
+    jam_flush_rate: float = 0.1
+    jam_flush_burst: int = 5
+
+    # Size of each read when streaming stored files out of the file database
+    blob_chunk_size: int = 256 * 1024
+    # Blob compression; below compress_min_bytes rows stay raw, from lzma_min_bytes on lzma is used
+    compress_min_bytes: int = 128
+    lzma_min_bytes: int = 256 * 1024
+    zlib_level: int = 6
+    lzma_preset: int = 6
+
+    # In-process cache for /midi/get
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_max_item_bytes: int = 1024 * 1024
+    cache_ttl_seconds: float = 300.0
+    # Dotted path ("package.module:Class") of a backend that shares invalidations between workers
+    cache_invalidation_backend: Optional[str] = None
+
+    # Resolved request principals; entries count as one unit each
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60.0
+
+    # Background maintenance
+    delete_batch_size: int = 500
+    orphan_sweep_interval: float = 3600.0
+    orphan_sweep_grace_seconds: float = 600.0
+    orphan_sweep_batch_size: int = 1000
+    summary_backfill_batch_size: int = 200
+
+    # Note-level edits; the edit log is folded into a new snapshot after this many versions
+    note_snapshot_interval: int = 64
+    note_cache_max_bytes: int = 32 * 1024 * 1024
+    # Solved tablature for /midi/tab, per file
+    tab_cache_max_bytes: int = 32 * 1024 * 1024
+
+    # Admission control. Token buckets refill at <policy>_rate per second up to
+    # <policy>_burst, per user (JWT subject) and per client IP; IP buckets are
+    # ip_rate_factor times larger. The backend is a dotted path like the cache's
+    rate_limit_enabled: bool = True
+    rate_limit_backend: Optional[str] = None
+    rate_limit_max_keys: int = 100000
+    ip_rate_factor: float = 4.0
+    auth_rate: float = 0.2
+    auth_burst: int = 10
+    generate_rate: float = 2.0
+    generate_burst: int = 20
+    render_rate: float = 0.5
+    render_burst: int = 10
+    # Tablature of stored files; cache hits are charged too, misses cost a solve
+    tab_rate: float = 1.0
+    tab_burst: int = 20
+    # Notes submitted for encoding, per user
+    notes_rate: float = 20000.0
+    notes_burst: int = 200000
+    max_notes_per_request: int = 50000
+    max_batch_notes: int = 200000
+    # Cost-weighted concurrency for process pool work: encoding costs a unit per started
+    # 1000 notes, rendering one per started 64 KiB of MIDI
+    encode_capacity: int = 256
+    render_capacity: int = 16
+    admission_queue_timeout: float = 5.0
+    admission_max_waiters: int = 64
+    # Zip import and export of whole libraries
+    bulk_rate: float = 0.02
+    bulk_burst: int = 3
+    max_import_bytes: int = 256 * 1024 * 1024
+    max_import_files: int = 10000
+    max_import_file_bytes: int = 4 * 1024 * 1024
+    # An import batch is stored once it reaches either limit
+    import_batch_size: int = 100
+    import_batch_bytes: int = 2 * 1024 * 1024
+
+    # Startup; schema changes normally go through `python -m db.migrate` before deploying
+    migrate_on_startup: bool = False
+    db_pool_warm_connections: int = 2
+    readiness_timeout: float = 2.0
+
     class Config:
         env_file = Path(Path(__file__).resolve().parent.parent) / ".env"
 
-print(f"Loading environment variables from: {Settings.Config.env_file}")
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    print(f"Loading environment variables from: {Settings.Config.env_file}")
+    return Settings()
+
+class LazySettings:
+    # Stands in for the Settings instance so importing this module doesn't read the
+    # environment; the first attribute access does
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+settings = LazySettings()
+
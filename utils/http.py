@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+from fastapi import HTTPException
+
+def http_date(value: datetime) -> str:
+    # Timestamps are stored as naive UTC
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+def accepts_encoding(header: Optional[str], encoding: str) -> bool:
+    # True when Accept-Encoding lists the coding (or *) with a non-zero q-value
+    if not header:
+        return False
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() not in (encoding, "*"):
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+def not_modified_since(header: Optional[str], last_modified: datetime) -> bool:
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # Returns an inclusive (start, end) for a single byte range, or None to send
+    # the whole representation; multiple ranges are not supported and are ignored
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            # Suffix range: the final N bytes
+            first = max(size - int(end), 0)
+            last = size - 1
+    except ValueError:
+        return None
+
+    if first >= size:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    if first > last:
+        return None
+
+    return first, min(last, size - 1)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from .lazy import lazy_import
+from .analysis import summarize_notes
+from .smf import DEFAULT_TEMPO, encode_midi
+
+np = lazy_import("numpy")
+
+class NoteRecorder:
+    # Append-only note buffer; columns grow by doubling so appends are amortised O(1)
+    def __init__(self, capacity: int = 1024):
+        self.count = 0
+        self.pitches = np.zeros(capacity, dtype=np.int64)
+        self.starts = np.zeros(capacity, dtype=np.float64)
+        self.ends = np.zeros(capacity, dtype=np.float64)
+        self.velocities = np.zeros(capacity, dtype=np.int64)
+
+    def append(self, pitch: int, start: float, duration: float, velocity: int):
+        if self.count == len(self.pitches):
+            for name in ("pitches", "starts", "ends", "velocities"):
+                column = getattr(self, name)
+                setattr(self, name, np.concatenate((column, np.zeros_like(column))))
+
+        index = self.count
+        self.pitches[index] = pitch
+        self.starts[index] = start
+        self.ends[index] = start + max(duration, 0.0)
+        self.velocities[index] = velocity
+        self.count += 1
+
+    def columns(self):
+        count = self.count
+        return self.pitches[:count], self.starts[:count], self.ends[:count], self.velocities[:count]
+
+    def encode(self, program: int) -> bytes:
+        return encode_midi(*self.columns(), program=program)
+
+    def summarize(self, program: int) -> dict:
+        pitches, starts, ends, _ = self.columns()
+        return summarize_notes(pitches, starts, ends, program, DEFAULT_TEMPO)
+
+    def clear(self):
+        self.count = 0
+
+class Participant:
+    def __init__(self, websocket, user_id, username: str, queue_size: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.username = username
+        self.outbox = asyncio.Queue(maxsize=queue_size)
+
+    def deliver(self, message: str) -> bool:
+        try:
+            self.outbox.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def pump(self):
+        # Drains this participant's outbox; messages arrive already encoded
+        while True:
+            await self.websocket.send_text(await self.outbox.get())
+
+class Room:
+    def __init__(self, room_id: str, program: int):
+        self.room_id = room_id
+        self.program = program
+        self.participants = {}
+        self.recorder = NoteRecorder()
+        self.started = time.monotonic()
+
+    def clock(self) -> float:
+        return time.monotonic() - self.started
+
+    def broadcast(self, message: str, sender=None) -> list:
+        # One pre-encoded message is queued for everyone but the sender; returns
+        # participants too slow to keep up so the caller can disconnect them
+        lagging = []
+        for participant in self.participants.values():
+            if participant is sender:
+                continue
+            if not participant.deliver(message):
+                lagging.append(participant)
+        return lagging
+
+class RoomRegistry:
+    def __init__(self):
+        self.rooms = {}
+
+    def join(self, room_id: str, program: int, participant: Participant) -> Room:
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room(room_id, program)
+        room.participants[id(participant)] = participant
+        return room
+
+    def leave(self, room: Room, participant: Participant):
+        room.participants.pop(id(participant), None)
+        # Unflushed recordings go away with the last participant
+        if not room.participants:
+            self.rooms.pop(room.room_id, None)
+
+rooms = RoomRegistry()
@@ -0,0 +1,78 @@
+import asyncio
+import time
+import traceback
+import uuid
+from typing import Optional
+
+class Job:
+    def __init__(self, kind: str, total: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "pending"
+        self.total = total
+        self.done = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def advance(self, count: int):
+        self.done += count
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobRegistry:
+    # Tracks background work in this process so clients can poll its progress
+    def __init__(self, keep_finished_seconds: float = 3600.0):
+        self.keep_finished_seconds = keep_finished_seconds
+        self._jobs = {}
+        self._tasks = set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def start(self, job: Job, work) -> Job:
+        # work is a coroutine function taking the job, so it can report progress
+        self._prune()
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._run(job, work))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, work):
+        job.status = "running"
+        try:
+            await work(job)
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            traceback.print_exc()
+        finally:
+            job.finished_at = time.time()
+
+    async def cancel_all(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_finished_seconds
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+jobs = JobRegistry()
@@ -0,0 +1,23 @@
+import importlib
+import importlib.util
+import sys
+
+def lazy_import(name: str):
+    # Registers the module without executing it; the import runs on first attribute
+    # access, so modules that only need it inside functions don't slow down startup
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def preload(*names: str):
+    # Finishes lazy imports ahead of time, e.g. in a thread during startup
+    for name in names:
+        getattr(importlib.import_module(name), "__name__")
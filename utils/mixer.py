@@ -0,0 +1,93 @@
+from __future__ import annotations
+from .lazy import lazy_import
+from .audio import RELEASE_SECONDS, MAX_SAMPLE_SECONDS, pitched_sample
+
+np = lazy_import("numpy")
+
+class BlockMixer:
+    # Mixes scheduled notes into fixed-size PCM blocks. Voice state lives in
+    # preallocated arrays and every per-block operation writes into reused
+    # buffers, so steady-state rendering does not allocate. `playing` and `free`
+    # partition the voice slots, so a block only visits the voices that sound.
+    def __init__(self, bank: str, sample_rate: int = 44100, block_size: int = 512, max_voices: int = 64):
+        self.bank = bank
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.max_voices = max_voices
+        self.frame = 0
+
+        self.release = int(RELEASE_SECONDS * sample_rate)
+        self.max_length = int(MAX_SAMPLE_SECONDS * sample_rate)
+        self.fade = np.linspace(1.0, 0.0, self.release, dtype=np.float32)
+
+        self.playing = []
+        self.free = list(range(max_voices - 1, -1, -1))
+        self.starts = np.zeros(max_voices, dtype=np.int64)
+        self.release_starts = np.zeros(max_voices, dtype=np.int64)
+        self.ends = np.zeros(max_voices, dtype=np.int64)
+        self.gains = np.zeros(max_voices, dtype=np.float32)
+        self.samples = [None] * max_voices
+
+        self.mix = np.zeros(block_size, dtype=np.float32)
+        self.scratch = np.zeros(block_size, dtype=np.float32)
+        self.pcm = np.zeros(block_size, dtype=np.int16)
+
+    def note_on(self, pitch: int, start_frame: int, length_frames: int, gain: float):
+        sample = pitched_sample(self.bank, pitch, self.sample_rate)
+        start_frame = max(start_frame, self.frame)
+        held = min(length_frames, self.max_length)
+        end_frame = start_frame + min(held + self.release, len(sample))
+
+        # Reuse a free voice, or steal the one that started first
+        if self.free:
+            voice = self.free.pop()
+            self.playing.append(voice)
+        else:
+            voice = int(self.starts.argmin())
+
+        self.starts[voice] = start_frame
+        self.release_starts[voice] = max(end_frame - self.release, start_frame)
+        self.ends[voice] = end_frame
+        self.gains[voice] = gain
+        self.samples[voice] = sample
+
+    def render(self) -> np.ndarray:
+        block_start = self.frame
+        block_end = block_start + self.block_size
+        self.mix.fill(0.0)
+
+        finished = False
+        for voice in self.playing:
+            if self.starts[voice] >= block_end:
+                continue
+            start = max(self.starts[voice], block_start)
+            end = min(self.ends[voice], block_end)
+            if end > start:
+                count = end - start
+                offset = start - self.starts[voice]
+                out = self.scratch[:count]
+                np.multiply(self.samples[voice][offset:offset + count], self.gains[voice], out=out)
+
+                # Linear release over the voice's last frames
+                fade_from = max(self.release_starts[voice], start)
+                if fade_from < end:
+                    fade_offset = fade_from - self.release_starts[voice]
+                    faded = out[fade_from - start:]
+                    np.multiply(faded, self.fade[fade_offset:fade_offset + len(faded)], out=faded)
+
+                mixed = self.mix[start - block_start:end - block_start]
+                np.add(mixed, out, out=mixed)
+
+            if self.ends[voice] <= block_end:
+                self.samples[voice] = None
+                finished = True
+
+        if finished:
+            self.free.extend(voice for voice in self.playing if self.samples[voice] is None)
+            self.playing = [voice for voice in self.playing if self.samples[voice] is not None]
+
+        self.frame = block_end
+        np.clip(self.mix, -1.0, 1.0, out=self.mix)
+        np.multiply(self.mix, 32767.0, out=self.mix)
+        np.copyto(self.pcm, self.mix, casting="unsafe")
+        return self.pcm
@@ -0,0 +1,174 @@
+import math
+import struct
+from .lazy import lazy_import
+from .smf import note_names_to_numbers
+
+np = lazy_import("numpy")
+
+# Snapshot layout: u32 count, u32 reserved, then f64 starts, f64 ends, u32 ids,
+# u8 pitches and u8 velocities, each `count` long
+_HEADER = struct.Struct("<II")
+
+class NoteArray:
+    # Decoded form of a stored file that note-level edits apply to. Ids are stable
+    # across edits and stay sorted, because new notes always get the next free id
+    def __init__(self, ids, pitches, starts, ends, velocities):
+        self.ids = np.asarray(ids, dtype=np.uint32)
+        self.pitches = np.asarray(pitches, dtype=np.uint8)
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.velocities = np.asarray(velocities, dtype=np.uint8)
+
+    @classmethod
+    def from_columns(cls, pitches, starts, ends, velocities, first_id: int = 0):
+        return cls(np.arange(first_id, first_id + len(pitches)), pitches, starts, ends, velocities)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        count, _ = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        starts = np.frombuffer(data, dtype="<f8", count=count, offset=offset)
+        ends = np.frombuffer(data, dtype="<f8", count=count, offset=offset + 8 * count)
+        ids = np.frombuffer(data, dtype="<u4", count=count, offset=offset + 16 * count)
+        pitches = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset + 20 * count)
+        velocities = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset + 21 * count)
+        return cls(ids, pitches, starts, ends, velocities)
+
+    def to_bytes(self) -> bytes:
+        return b"".join((
+            _HEADER.pack(len(self.ids), 0),
+            self.starts.astype("<f8").tobytes(),
+            self.ends.astype("<f8").tobytes(),
+            self.ids.astype("<u4").tobytes(),
+            self.pitches.tobytes(),
+            self.velocities.tobytes(),
+        ))
+
+    @property
+    def nbytes(self) -> int:
+        return _HEADER.size + 22 * len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def columns(self):
+        return self.pitches, self.starts, self.ends, self.velocities
+
+    def apply(self, ops: list) -> "NoteArray":
+        # Applies normalized edit ops and returns a new array:
+        #   {"op": "insert", "id", "pitch", "start", "end", "velocity"}
+        #   {"op": "update", "id", and any of "pitch", "start", "duration", "velocity"}
+        #   {"op": "delete", "id"}
+        # Raises KeyError for ids that don't exist (or no longer do)
+        pitches = self.pitches.copy()
+        starts = self.starts.copy()
+        ends = self.ends.copy()
+        velocities = self.velocities.copy()
+        keep = np.ones(len(self.ids), dtype=bool)
+        added = {}
+
+        for op in ops:
+            note_id = op["id"]
+            if op["op"] == "insert":
+                added[note_id] = [op["pitch"], op["start"], op["end"], op["velocity"]]
+                continue
+
+            if note_id in added:
+                note = added[note_id]
+                if op["op"] == "delete":
+                    del added[note_id]
+                else:
+                    start = op.get("start", note[1])
+                    note[:] = [
+                        op.get("pitch", note[0]),
+                        start,
+                        start + op.get("duration", note[2] - note[1]),
+                        op.get("velocity", note[3]),
+                    ]
+                continue
+
+            index = int(np.searchsorted(self.ids, note_id))
+            if index == len(self.ids) or self.ids[index] != note_id or not keep[index]:
+                raise KeyError(note_id)
+            if op["op"] == "delete":
+                keep[index] = False
+            else:
+                start = op.get("start", starts[index])
+                duration = op.get("duration", ends[index] - starts[index])
+                starts[index] = start
+                ends[index] = start + duration
+                pitches[index] = op.get("pitch", pitches[index])
+                velocities[index] = op.get("velocity", velocities[index])
+
+        new_notes = list(added.values())
+        return NoteArray(
+            np.concatenate((self.ids[keep], np.fromiter(added, dtype=np.uint32, count=len(added)))),
+            np.concatenate((pitches[keep], np.array([note[0] for note in new_notes], dtype=np.uint8))),
+            np.concatenate((starts[keep], np.array([note[1] for note in new_notes], dtype=np.float64))),
+            np.concatenate((ends[keep], np.array([note[2] for note in new_notes], dtype=np.float64))),
+            np.concatenate((velocities[keep], np.array([note[3] for note in new_notes], dtype=np.uint8))),
+        )
+
+DEFAULT_VELOCITY = 0.8
+
+def _velocity(value: float) -> int:
+    if not 0.0 <= value <= 1.0:
+        raise ValueError("velocity must be between 0 and 1")
+    return int(round(value * 127))
+
+def _seconds(name: str, value: float) -> float:
+    if not (math.isfinite(value) and value >= 0):
+        raise ValueError(f"{name} must be a non-negative number of seconds")
+    return value
+
+def normalize_ops(ops: list, next_id: int):
+    # Turns NoteOp requests into the stored form NoteArray.apply understands,
+    # assigning ids to inserted notes; returns (normalized ops, inserted ids)
+    names = [op.note for op in ops if op.note is not None]
+    numbers = iter(note_names_to_numbers(names).tolist() if names else ())
+
+    normalized, inserted = [], []
+    for op in ops:
+        pitch = next(numbers) if op.note is not None else op.pitch
+        if pitch is not None and not 0 <= pitch <= 127:
+            raise ValueError("pitch must be in range 0..127")
+        time = _seconds("time", op.time) if op.time is not None else None
+        duration = _seconds("duration", op.duration) if op.duration is not None else None
+        velocity = _velocity(op.velocity) if op.velocity is not None else None
+
+        if op.op == "insert":
+            if pitch is None or time is None or duration is None:
+                raise ValueError("insert needs a note or pitch, a time and a duration")
+            inserted.append(next_id)
+            normalized.append({
+                "op": "insert",
+                "id": next_id,
+                "pitch": pitch,
+                "start": time,
+                "end": time + duration,
+                "velocity": velocity if velocity is not None else _velocity(DEFAULT_VELOCITY),
+            })
+            next_id += 1
+            continue
+
+        if op.id is None:
+            raise ValueError(f"{op.op} needs the id of the note")
+        if op.op == "delete":
+            normalized.append({"op": "delete", "id": op.id})
+        elif op.op == "velocity":
+            if velocity is None:
+                raise ValueError("velocity op needs a velocity")
+            normalized.append({"op": "update", "id": op.id, "velocity": velocity})
+        else:
+            change = {"op": "update", "id": op.id}
+            if pitch is not None:
+                change["pitch"] = pitch
+            if time is not None:
+                change["start"] = time
+            if duration is not None:
+                change["duration"] = duration
+            if len(change) == 2:
+                raise ValueError("move needs a new time, duration, note or pitch")
+            normalized.append(change)
+
+    return normalized, inserted
@@ -0,0 +1,58 @@
+import struct
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Binary note upload for /midi/generate/packed, little-endian:
+#   16-byte header: b"GEBN", u16 version, u16 reserved, u32 note count, u32 reserved
+#   f64 start times[count], f64 durations[count]  (seconds)
+#   u8 pitches[count], u8 velocities[count]        (MIDI numbers, 0..127)
+# Float columns come first so they stay 8-byte aligned.
+PACKED_MAGIC = b"GEBN"
+PACKED_VERSION = 1
+PACKED_CONTENT_TYPE = "application/vnd.geb.notes"
+_HEADER = struct.Struct("<4sHHII")
+NOTE_SIZE = 18
+
+def packed_size(count: int) -> int:
+    return _HEADER.size + count * NOTE_SIZE
+
+def pack_notes(pitches, starts, durations, velocities) -> bytes:
+    count = len(pitches)
+    return b"".join((
+        _HEADER.pack(PACKED_MAGIC, PACKED_VERSION, 0, count, 0),
+        np.asarray(starts, dtype="<f8").tobytes(),
+        np.asarray(durations, dtype="<f8").tobytes(),
+        np.asarray(pitches, dtype=np.uint8).tobytes(),
+        np.asarray(velocities, dtype=np.uint8).tobytes(),
+    ))
+
+def unpack_notes(data: bytes, max_notes: int = None):
+    # Views straight into the request body; returns (pitch, start, end, velocity) columns
+    if len(data) < _HEADER.size:
+        raise ValueError("Packed notes are missing their header")
+    magic, version, _, count, _ = _HEADER.unpack_from(data)
+    if magic != PACKED_MAGIC or version != PACKED_VERSION:
+        raise ValueError("Unsupported packed notes format")
+    if max_notes is not None and count > max_notes:
+        raise ValueError(f"At most {max_notes} notes can be uploaded at once")
+    if len(data) != packed_size(count):
+        raise ValueError("Packed notes length does not match the note count")
+
+    offset = _HEADER.size
+    starts = np.frombuffer(data, dtype="<f8", count=count, offset=offset)
+    durations = np.frombuffer(data, dtype="<f8", count=count, offset=offset + 8 * count)
+    pitches = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset + 16 * count)
+    velocities = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset + 17 * count)
+
+    if count:
+        if not (np.isfinite(starts).all() and np.isfinite(durations).all()):
+            raise ValueError("Times and durations must be finite")
+        if starts.min() < 0 or durations.min() < 0:
+            raise ValueError("Times and durations must not be negative")
+        if pitches.max() > 127:
+            raise ValueError("pitch must be in range 0..127")
+        if velocities.max() > 127:
+            raise ValueError("velocity must be in range 0..127")
+
+    return pitches, starts, starts + durations, velocities
@@ -0,0 +1,71 @@
+import base64
+import json
+import time
+import uuid
+from datetime import datetime
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 100
+
+def validate_limit(limit: int):
+    if limit <= 0 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Limit must be between 1 and {MAX_PAGE_SIZE}")
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_search_cursor(sort: str, value, row_id) -> str:
+    # Keyset position for an arbitrary sort column; the column name is kept so a
+    # cursor can't be replayed against a different ordering
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, str(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        cursor_sort, value, row_id = json.loads(raw)
+        if cursor_sort != sort:
+            raise ValueError("Cursor belongs to a different sort order")
+        if sort == "created_at":
+            value = datetime.fromisoformat(value)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Invalid cursor value")
+        return value, uuid.UUID(row_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+class CountCache:
+    # Keeps approximate totals for a while so listing endpoints don't run COUNT(*) per call
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key, value):
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
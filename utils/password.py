@@ -1,12 +1,71 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
-from fastapi.security import OAuth2PasswordBearer
+from .config import settings
+from .metrics import Histogram
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hash_seconds = Histogram("password_hash_duration_seconds", "bcrypt time per call, excluding queueing", ("operation",))
 
-def secure_pwd(raw_password):
-    hashed = pwd_context.hash(raw_password)
+@lru_cache(maxsize=None)
+def get_pwd_context() -> CryptContext:
+    # Hashes with fewer rounds than bcrypt_rounds are reported as needing an update,
+    # so they get upgraded on the next successful login.
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=settings.bcrypt_rounds,
+        bcrypt__min_rounds=settings.bcrypt_rounds,
+    )
 
-    return hashed
+# bcrypt releases the GIL, so a small thread pool hashes in parallel without
+# touching the event loop thread. Created on first use, like the process pool
+_executor = None
+_pending = 0
 
-def verify_pwd(plain, hash):
-    return pwd_context.verify(plain, hash)
\ No newline at end of file
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
+    return _executor
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    return func(*args), time.perf_counter() - started
+
+async def _run_in_pool(operation: str, func, *args):
+    global _pending
+    if _pending >= settings.password_hash_workers + settings.password_hash_queue_limit:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    _pending += 1
+    try:
+        result, elapsed = await asyncio.get_running_loop().run_in_executor(get_executor(), _timed, func, *args)
+    finally:
+        _pending -= 1
+
+    # Recorded on the event loop thread so observations never race
+    password_hash_seconds.labels(operation).observe(elapsed)
+    return result
+
+async def secure_pwd(raw_password):
+    return await _run_in_pool("hash", get_pwd_context().hash, raw_password)
+
+async def verify_pwd(plain, hash):
+    return await _run_in_pool("verify", get_pwd_context().verify, plain, hash)
+
+async def verify_and_update_pwd(plain, hash):
+    # Returns (is_valid, new_hash); new_hash is None unless the stored hash is outdated
+    return await _run_in_pool("verify", get_pwd_context().verify_and_update, plain, hash)
+
+def shutdown_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,264 @@
+from __future__ import annotations
+import struct
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Defaults used by pretty_midi.PrettyMIDI(), kept so stored files stay byte-identical
+DEFAULT_RESOLUTION = 220
+DEFAULT_TEMPO = 120.0
+
+MAX_VLQ = 0x0FFFFFFF
+
+def note_names_to_numbers(names) -> np.ndarray:
+    import pretty_midi
+
+    # Songs reuse a handful of names, so only convert each distinct one once
+    unique, inverse = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+    lookup = np.fromiter((pretty_midi.note_name_to_number(name) for name in unique), dtype=np.int64, count=len(unique))
+    return lookup[inverse]
+
+def notes_to_arrays(notes):
+    # Splits a list of NoteEvent into (pitch, start, end, velocity) columns
+    count = len(notes)
+    starts = np.fromiter((event.time for event in notes), dtype=np.float64, count=count)
+    durations = np.fromiter((event.duration for event in notes), dtype=np.float64, count=count)
+    velocities = np.fromiter((event.velocity for event in notes), dtype=np.float64, count=count)
+    pitches = note_names_to_numbers([event.note for event in notes]) if count else np.empty(0, dtype=np.int64)
+
+    return pitches, starts, starts + durations, (velocities * 127).astype(np.int64)
+
+def seconds_to_ticks(times: np.ndarray, resolution: int = DEFAULT_RESOLUTION, tempo: float = DEFAULT_TEMPO) -> np.ndarray:
+    tick_scale = 60.0 / (tempo * resolution)
+    # Same quantization as PrettyMIDI.time_to_tick: non-positive times map to tick 0,
+    # everything else rounds half to even
+    ticks = np.rint(np.asarray(times, dtype=np.float64) / tick_scale)
+    return np.where(times > 0, ticks, 0).astype(np.int64)
+
+def _vlq_lengths(values: np.ndarray) -> np.ndarray:
+    return 1 + (values >= 1 << 7).astype(np.int64) + (values >= 1 << 14) + (values >= 1 << 21)
+
+def _write_vlqs(buffer: np.ndarray, offsets: np.ndarray, values: np.ndarray, lengths: np.ndarray):
+    # Byte k of an n-byte quantity holds bits 7*(n-1-k) and up, with the continuation bit on all but the last
+    for k in range(4):
+        mask = lengths > k
+        if not mask.any():
+            break
+        shift = 7 * (lengths[mask] - 1 - k)
+        continuation = np.where(lengths[mask] - 1 > k, 0x80, 0)
+        buffer[offsets[mask] + k] = ((values[mask] >> shift) & 0x7F) | continuation
+
+def _validate(name: str, values: np.ndarray, upper: int):
+    if values.size and (values.min() < 0 or values.max() > upper):
+        raise ValueError(f"{name} must be in range 0..{upper}")
+
+def encode_midi(
+    pitches,
+    starts,
+    ends,
+    velocities,
+    program: int = 0,
+    channel: int = 0,
+    resolution: int = DEFAULT_RESOLUTION,
+    tempo: float = DEFAULT_TEMPO
+) -> bytes:
+    pitches = np.asarray(pitches, dtype=np.int64)
+    velocities = np.asarray(velocities, dtype=np.int64)
+    _validate("pitch", pitches, 127)
+    _validate("velocity", velocities, 127)
+    _validate("program", np.asarray([program]), 127)
+
+    count = len(pitches)
+    on_ticks = seconds_to_ticks(np.asarray(starts, dtype=np.float64), resolution, tempo)
+    off_ticks = seconds_to_ticks(np.asarray(ends, dtype=np.float64), resolution, tempo)
+
+    # Interleave note-ons with their note-offs (note-on, velocity 0) and order them
+    # by tick, then pitch, then velocity, which puts a note-off ahead of a note-on
+    # of the same pitch on the same tick
+    ticks = np.concatenate((on_ticks, off_ticks))
+    event_pitches = np.concatenate((pitches, pitches))
+    event_velocities = np.concatenate((velocities, np.zeros(count, dtype=np.int64)))
+    order = np.lexsort((event_velocities, event_pitches, ticks))
+    ticks = ticks[order]
+    event_pitches = event_pitches[order]
+    event_velocities = event_velocities[order]
+
+    deltas = np.diff(ticks, prepend=0)
+    if deltas.size and deltas.max() > MAX_VLQ:
+        raise ValueError("Song is too long to encode")
+
+    # Every event is <delta><pitch><velocity>; only the first carries the status
+    # byte, the rest reuse it through running status
+    vlq_lengths = _vlq_lengths(deltas)
+    event_lengths = vlq_lengths + 2
+    if event_lengths.size:
+        event_lengths[0] += 1
+    events_size = int(event_lengths.sum())
+
+    tempo_us = int(6e7 / (60. / ((60.0 / (tempo * resolution)) * resolution)))
+    timing_track = (
+        b'\x00\xff\x51\x03' + tempo_us.to_bytes(3, 'big')  # set_tempo
+        + b'\x00\xff\x58\x04\x04\x02\x18\x08'               # 4/4 time signature
+        + b'\x01\xff\x2f\x00'                               # end_of_track
+    )
+    program_change = bytes((0, 0xC0 | channel, program))
+    end_of_track = b'\x01\xff\x2f\x00'
+    note_track_size = len(program_change) + events_size + len(end_of_track)
+
+    header = b'MThd' + struct.pack('>Ihhh', 6, 1, 2, resolution)
+    prefix = (
+        header
+        + b'MTrk' + struct.pack('>I', len(timing_track)) + timing_track
+        + b'MTrk' + struct.pack('>I', note_track_size) + program_change
+    )
+
+    buffer = np.empty(len(prefix) + events_size + len(end_of_track), dtype=np.uint8)
+    buffer[:len(prefix)] = np.frombuffer(prefix, dtype=np.uint8)
+    buffer[len(prefix) + events_size:] = np.frombuffer(end_of_track, dtype=np.uint8)
+
+    if count:
+        offsets = len(prefix) + np.concatenate(([0], np.cumsum(event_lengths[:-1])))
+        _write_vlqs(buffer, offsets, deltas, vlq_lengths)
+        data_offsets = offsets + vlq_lengths
+        buffer[data_offsets[0]] = 0x90 | channel
+        data_offsets[0] += 1
+        buffer[data_offsets] = event_pitches
+        buffer[data_offsets + 1] = event_velocities
+
+    return buffer.tobytes()
+
+def encode_notes(pitches, starts, ends, velocities, instrument_name: str):
+    # Encoded file plus its searchable summary, for any source of note columns
+    import pretty_midi
+    from .analysis import summarize_notes
+
+    program = pretty_midi.instrument_name_to_program(instrument_name)
+    file_data = encode_midi(pitches, starts, ends, velocities, program=program)
+    return file_data, summarize_notes(pitches, starts, ends, program, DEFAULT_TEMPO)
+
+def encode_request(midi_data):
+    # Full encode for a MidiRequest; top-level so it can run in a worker process
+    return encode_notes(*notes_to_arrays(midi_data.notes), midi_data.instrument_name)
+
+# Data bytes that follow each channel message status (high nibble)
+_CHANNEL_MESSAGE_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+def _read_vlq(data: bytes, pos: int):
+    value = 0
+    for _ in range(4):
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+    raise ValueError("Invalid variable-length quantity")
+
+def _parse_track(data: bytes, pos: int, end: int, notes: list, tempos: list, programs: list):
+    tick = 0
+    status = None
+    # (channel, pitch) -> notes waiting for their note-off; like pretty_midi,
+    # notes that are never released are dropped
+    open_notes = {}
+
+    while pos < end:
+        delta, pos = _read_vlq(data, pos)
+        tick += delta
+
+        byte = data[pos]
+        if byte & 0x80:
+            pos += 1
+            if byte < 0xF0:
+                status = byte
+        elif status is None:
+            raise ValueError("Running status without a preceding status byte")
+        else:
+            byte = status
+
+        if byte == 0xFF:
+            meta_type = data[pos]
+            length, pos = _read_vlq(data, pos + 1)
+            if meta_type == 0x51 and length == 3:
+                tempos.append((tick, int.from_bytes(data[pos:pos + 3], 'big')))
+            elif meta_type == 0x2F:
+                break
+            pos += length
+        elif byte in (0xF0, 0xF7):
+            length, pos = _read_vlq(data, pos)
+            pos += length
+        elif byte >= 0xF0:
+            raise ValueError("Unexpected system message in track")
+        else:
+            kind = byte & 0xF0
+            channel = byte & 0x0F
+            args = data[pos:pos + _CHANNEL_MESSAGE_LENGTHS[kind]]
+            pos += _CHANNEL_MESSAGE_LENGTHS[kind]
+
+            if kind == 0x90 and args[1] > 0:
+                open_notes.setdefault((channel, args[0]), []).append((tick, args[1]))
+            elif kind == 0x80 or kind == 0x90:
+                # A note-off closes every earlier note-on of that pitch, but not one
+                # started on this same tick (pretty_midi reads files the same way)
+                started = open_notes.get((channel, args[0]))
+                if started:
+                    for start_tick, velocity in started:
+                        if start_tick != tick:
+                            notes.append((start_tick, tick, args[0], velocity, channel))
+                    started[:] = [note for note in started if note[0] == tick]
+            elif kind == 0xC0 and channel != 9:
+                programs.append((tick, args[0]))
+
+def decode_midi(data: bytes, include_tempo: bool = False):
+    # Parses a Standard MIDI File into (pitch, start, end, velocity) columns plus the
+    # first melodic program; times are in seconds, following the file's tempo map.
+    # With include_tempo the initial tempo in BPM is appended
+    try:
+        if data[:4] != b'MThd':
+            raise ValueError("Not a Standard MIDI File")
+        header_length, _, track_count, division = struct.unpack('>IHHh', data[4:14])
+
+        notes, tempos, programs = [], [], []
+        pos = 8 + header_length
+        for _ in range(track_count):
+            chunk_type = data[pos:pos + 4]
+            length, = struct.unpack('>I', data[pos + 4:pos + 8])
+            pos += 8
+            if chunk_type == b'MTrk':
+                _parse_track(data, pos, min(pos + length, len(data)), notes, tempos, programs)
+            pos += length
+    except (IndexError, KeyError, struct.error):
+        raise ValueError("Invalid MIDI file")
+
+    if division < 0:
+        # SMPTE timing: frames per second times ticks per frame, tempo does not apply
+        ticks_per_second = -(division >> 8) * (division & 0xFF)
+        seconds = lambda ticks: ticks / ticks_per_second
+    else:
+        if division == 0:
+            raise ValueError("Invalid MIDI file")
+        tempos.sort()
+        change_ticks = np.array([0] + [tick for tick, _ in tempos], dtype=np.int64)
+        change_tempos = np.array([500000] + [tempo for _, tempo in tempos], dtype=np.float64)
+        seconds_per_tick = change_tempos / 1e6 / division
+        # Elapsed seconds at each tempo change
+        change_seconds = np.concatenate(([0.0], np.cumsum(np.diff(change_ticks) * seconds_per_tick[:-1])))
+
+        def seconds(ticks):
+            index = np.searchsorted(change_ticks, ticks, side='right') - 1
+            return change_seconds[index] + (ticks - change_ticks[index]) * seconds_per_tick[index]
+
+    columns = np.array(sorted(notes), dtype=np.int64).reshape(-1, 5)
+    starts = seconds(columns[:, 0].astype(np.float64))
+    ends = seconds(columns[:, 1].astype(np.float64))
+    program = min(programs)[1] if programs else 0
+
+    if include_tempo:
+        initial = [tempo for tick, tempo in tempos if tick == 0]
+        tempo = 6e7 / initial[-1] if initial and initial[-1] else DEFAULT_TEMPO
+        return columns[:, 2], starts, ends, columns[:, 3], program, tempo
+    return columns[:, 2], starts, ends, columns[:, 3], program
+
+def summarize_midi(data: bytes) -> dict:
+    from .analysis import summarize_notes
+
+    pitches, starts, ends, _, program, tempo = decode_midi(data, include_tempo=True)
+    return summarize_notes(pitches, starts, ends, program, tempo)
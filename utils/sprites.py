@@ -0,0 +1,79 @@
+import hashlib
+import json
+from pathlib import Path
+from fastapi.staticfiles import StaticFiles
+from .audio import BANKS, SAMPLE_ROOT, sample_name_to_number
+
+SPRITE_DIR = Path(__file__).resolve().parent.parent / "build" / "sprites"
+SPRITE_URL = "/static/sprites"
+# The only file that isn't content-addressed, so clients can discover the current sprites
+INDEX_NAME = "index.json"
+
+def _content_name(prefix: str, data: bytes, suffix: str) -> str:
+    return f"{prefix}.{hashlib.sha256(data).hexdigest()[:16]}{suffix}"
+
+def _write_once(path: Path, data: bytes):
+    # Content-addressed names never change content, so existing files are left alone
+    if not path.exists():
+        temporary = path.with_suffix(path.suffix + ".tmp")
+        temporary.write_bytes(data)
+        temporary.replace(path)
+
+def build_sprites(source: Path = SAMPLE_ROOT, target: Path = SPRITE_DIR) -> dict:
+    # Packs each instrument directory into one sprite of back-to-back MP3s plus a
+    # manifest of note -> byte range; each sample stays independently decodable
+    target.mkdir(parents=True, exist_ok=True)
+    index = {}
+    keep = {INDEX_NAME}
+
+    for directory in BANKS.values():
+        paths = sorted((source / directory).glob("*.mp3"), key=lambda path: sample_name_to_number(path.stem))
+        sprite = bytearray()
+        notes = {}
+        for path in paths:
+            data = path.read_bytes()
+            notes[path.stem] = {"midi": sample_name_to_number(path.stem), "offset": len(sprite), "length": len(data)}
+            sprite += data
+
+        sprite_name = _content_name(directory, sprite, ".mp3")
+        manifest = json.dumps({
+            "instrument": directory,
+            "sprite": f"{SPRITE_URL}/{sprite_name}",
+            "size": len(sprite),
+            "content_type": "audio/mpeg",
+            "notes": notes,
+        }, indent=2).encode()
+        manifest_name = _content_name(directory, manifest, ".json")
+
+        _write_once(target / sprite_name, bytes(sprite))
+        _write_once(target / manifest_name, manifest)
+        keep.update((sprite_name, manifest_name))
+        index[directory] = {"manifest": f"{SPRITE_URL}/{manifest_name}", "sprite": f"{SPRITE_URL}/{sprite_name}"}
+
+    (target / INDEX_NAME).write_text(json.dumps(index, indent=2))
+
+    # Drop sprites left over from sample banks that have since changed
+    for path in target.iterdir():
+        if path.name not in keep:
+            path.unlink()
+
+    return index
+
+def ensure_sprites():
+    # Startup hook: the build step normally produced these already
+    if not (SPRITE_DIR / INDEX_NAME).exists():
+        build_sprites()
+
+class SpriteFiles(StaticFiles):
+    # Hashed files can be cached forever; Starlette's FileResponse already handles Range
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if Path(full_path).name == INDEX_NAME:
+            response.headers["Cache-Control"] = "no-cache"
+        else:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+if __name__ == "__main__":
+    for instrument, urls in build_sprites().items():
+        print(f"{instrument}: {urls['sprite']}")
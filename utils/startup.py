@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+
+class StartupReport:
+    # Time from the app module starting to import, through each startup phase, to
+    # readiness and the first request served; phases inside a gather overlap
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.ready_at = None
+        self.first_request_at = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    async def timed(self, name: str, awaitable):
+        with self.phase(name):
+            return await awaitable
+
+    def mark_ready(self):
+        self.ready_at = self.elapsed()
+
+    def mark_request(self):
+        if self.first_request_at is None:
+            self.first_request_at = self.elapsed()
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "ready_seconds": self.ready_at,
+            "first_request_seconds": self.first_request_at,
+        }
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        return f"Ready after {self.ready_at * 1000:.0f}ms ({phases})"
+
+startup = StartupReport()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+from functools import lru_cache
+from typing import NamedTuple
+from .audio import bank_for_program, sample_name_to_number
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Open strings of each sample bank, lowest first, spelled like the sample files
+TUNINGS = {
+    "acoustic": ("E2", "A2", "D3", "G3", "B3", "E4"),
+    "electric": ("E2", "A2", "D3", "G3", "B3", "E4"),
+    "bass": ("E1", "A1", "D2", "G2"),
+}
+FRETS = {"acoustic": 19, "electric": 22, "bass": 20}
+# Widest reach, in frets, between the lowest and highest fretted note of one chord
+MAX_SPAN = {"acoustic": 4, "electric": 4, "bass": 3}
+
+# Notes starting within this many seconds of a chord's first note are played with it
+CHORD_WINDOW = 0.03
+# Only the cheapest voicings of a chord are considered, which keeps each DP step bounded
+MAX_VOICINGS = 32
+
+# Hand movement cost model. Shifting the fretting hand costs SHIFT_COST per fret,
+# more when there's little time to do it; the picking hand pays STRING_COST per
+# string it travels. Within a chord, stretches past two frets and playing high up
+# the neck cost extra. Open strings don't pin the fretting hand anywhere
+SHIFT_COST = 1.0
+QUICK_SHIFT_SECONDS = 0.25
+MIN_GAP_SECONDS = 0.02
+STRING_COST = 0.3
+STRETCH_COST = 1.5
+HEIGHT_COST = 0.05
+
+class Voicings(NamedTuple):
+    # Ways to play one chord, cheapest first. `kept` indexes the chord's pitches that
+    # could be placed; strings and frets are (voicings, kept) arrays
+    kept: tuple
+    strings: np.ndarray
+    frets: np.ndarray
+    cost: np.ndarray
+    anchor: np.ndarray
+    centroid: np.ndarray
+
+@lru_cache(maxsize=None)
+def open_strings(bank: str) -> tuple:
+    return tuple(sample_name_to_number(name) for name in TUNINGS[bank])
+
+@lru_cache(maxsize=None)
+def position_table(bank: str) -> tuple:
+    # For every MIDI pitch, the (string, fret) pairs that sound it
+    frets = FRETS[bank]
+    return tuple(
+        tuple((string, pitch - open_pitch) for string, open_pitch in enumerate(open_strings(bank)) if 0 <= pitch - open_pitch <= frets)
+        for pitch in range(128)
+    )
+
+def _place(positions: list, max_span: int) -> list:
+    # Every assignment of the pitches to distinct strings within one hand's reach
+    found = []
+
+    def place(index, used, low, high, chosen):
+        if index == len(positions):
+            found.append(chosen)
+            return
+        for string, fret in positions[index]:
+            if used >> string & 1:
+                continue
+            if fret:
+                new_low, new_high = min(low, fret), max(high, fret)
+                if new_high - new_low > max_span:
+                    continue
+            else:
+                new_low, new_high = low, high
+            place(index + 1, used | 1 << string, new_low, new_high, chosen + ((string, fret),))
+
+    place(0, 0, float("inf"), float("-inf"), ())
+    return found
+
+@lru_cache(maxsize=4096)
+def chord_voicings(bank: str, pitches: tuple):
+    # Returns None when nothing in the chord is playable. Chords that can't be played
+    # whole lose inner notes first, keeping the bass and the melody
+    table = position_table(bank)
+    kept = [index for index, pitch in enumerate(pitches) if 0 <= pitch < 128 and table[pitch]]
+    while len(kept) > len(open_strings(bank)):
+        del kept[len(kept) // 2]
+
+    found = []
+    while kept:
+        found = _place([table[pitches[index]] for index in kept], MAX_SPAN[bank])
+        if found:
+            break
+        del kept[len(kept) // 2]
+    if not found:
+        return None
+
+    placed = np.array(found, dtype=np.int64)
+    strings, frets = placed[:, :, 0], placed[:, :, 1]
+    fretted = frets > 0
+    low = np.where(fretted, frets, np.inf).min(axis=1)
+    high = np.where(fretted, frets, -np.inf).max(axis=1)
+    span = np.where(fretted.any(axis=1), high - low, 0)
+    cost = STRETCH_COST * np.maximum(span - 2, 0) ** 2 + HEIGHT_COST * frets.sum(axis=1)
+
+    best = np.argsort(cost, kind="stable")[:MAX_VOICINGS]
+    return Voicings(
+        kept=tuple(kept),
+        strings=strings[best],
+        frets=frets[best],
+        cost=cost[best],
+        anchor=np.where(np.isinf(low), np.nan, low)[best],
+        centroid=strings.mean(axis=1)[best],
+    )
+
+def transition_costs(previous: Voicings, current: Voicings, gap: float) -> np.ndarray:
+    # (previous voicings, current voicings) matrix of hand movement costs
+    shift = np.nan_to_num(np.abs(previous.anchor[:, None] - current.anchor[None, :]), nan=0.0)
+    urgency = 1.0 + QUICK_SHIFT_SECONDS / max(gap, MIN_GAP_SECONDS)
+    crossing = np.abs(previous.centroid[:, None] - current.centroid[None, :])
+    return SHIFT_COST * urgency * shift + STRING_COST * crossing
+
+def chord_frames(starts: np.ndarray, max_size: int) -> list:
+    # Note indexes grouped into chords of at most max_size notes, in playing order.
+    # The window is measured from each chord's first note, so fast runs can't chain
+    order = np.argsort(starts, kind="stable")
+    ordered = starts[order].tolist()
+    frames = []
+    first = 0
+    for index in range(1, len(order)):
+        if ordered[index] - ordered[first] > CHORD_WINDOW or index - first >= max_size:
+            frames.append(order[first:index])
+            first = index
+    if len(order):
+        frames.append(order[first:])
+    return frames
+
+def solve_tab(pitches, starts, bank: str) -> dict:
+    # Cheapest string/fret assignment under the cost model. Viterbi over chords: each
+    # step only compares the voicings of two neighbouring chords, so the work grows
+    # linearly with the number of notes
+    pitches = np.asarray(pitches, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.float64)
+    strings = np.full(len(pitches), -1, dtype=np.int64)
+    frets = np.full(len(pitches), -1, dtype=np.int64)
+
+    steps = []
+    for frame in chord_frames(starts, len(open_strings(bank))):
+        frame = frame[np.argsort(pitches[frame], kind="stable")]
+        voicings = chord_voicings(bank, tuple(pitches[frame].tolist()))
+        if voicings is not None:
+            steps.append((frame[list(voicings.kept)], voicings, starts[frame[0]]))
+
+    total = 0.0
+    if steps:
+        cost = steps[0][1].cost
+        back = []
+        for (_, previous, previous_start), (_, current, start) in zip(steps, steps[1:]):
+            candidates = cost[:, None] + transition_costs(previous, current, start - previous_start)
+            best = candidates.argmin(axis=0)
+            back.append(best)
+            cost = candidates[best, np.arange(len(best))] + current.cost
+
+        choice = int(cost.argmin())
+        total = float(cost[choice])
+        for index in range(len(steps) - 1, -1, -1):
+            notes, voicings, _ = steps[index]
+            strings[notes] = voicings.strings[choice]
+            frets[notes] = voicings.frets[choice]
+            if index:
+                choice = int(back[index - 1][choice])
+
+    # Tab numbering: string 1 is the highest
+    string_count = len(open_strings(bank))
+    return {
+        "bank": bank,
+        "tuning": list(reversed(TUNINGS[bank])),
+        "strings": [string_count - string if string >= 0 else None for string in strings.tolist()],
+        "frets": [fret if fret >= 0 else None for fret in frets.tolist()],
+        "unplayable": int((frets < 0).sum()),
+        "cost": round(total, 3),
+    }
+
+def tab_for_request(tab_request) -> dict:
+    # Top-level so it can run in a worker process; results follow the request's note order
+    from .smf import notes_to_arrays
+
+    pitches, starts, _, _ = notes_to_arrays(tab_request.notes)
+    return solve_tab(pitches, starts, tab_request.bank)
+
+def tab_for_midi(data: bytes, bank: str = None) -> dict:
+    # Without a bank the file's program picks one, as for rendering. Pitches and times
+    # come along so clients can line the positions up with the decoded notes
+    from .smf import decode_midi
+
+    pitches, starts, _, _, program = decode_midi(data)
+    tab = solve_tab(pitches, starts, bank or bank_for_program(program))
+    tab["pitches"] = pitches.tolist()
+    tab["times"] = starts.tolist()
+    return tab
@@ -0,0 +1,22 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .config import settings
+
+_pool = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    # Created on first use so requests that never need it don't pay for forking workers
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.encode_workers or os.cpu_count())
+    return _pool
+
+async def run_in_process(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_process_pool(), func, *args)
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
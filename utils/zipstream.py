@@ -0,0 +1,210 @@
+import struct
+import zipfile
+import zlib
+
+# Streaming zip support for library import/export. Reading walks the local file
+# headers front to back, so an upload never needs to be held or seeked; writing goes
+# through zipfile on a sink that is drained after every write.
+
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+END_SIGNATURE = b"PK\x05\x06"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+# signature, version, flags, method, time, date, crc, compressed size, size, name length, extra length
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_ZIP64_EXTRA = 0x0001
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+# Largest piece inflated at once, which also bounds what a zip bomb can allocate per step
+_INFLATE_STEP = 64 * 1024
+
+class _Reader:
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+
+    async def _fill(self) -> bool:
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return False
+        self._buffer += chunk
+        return True
+
+    async def read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            if not await self._fill():
+                raise ValueError("Zip archive is truncated")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def read_some(self, limit: int = None) -> bytes:
+        # Whatever is buffered or arrives next, at most `limit` bytes; b"" at the end
+        if not self._buffer and not await self._fill():
+            return b""
+        size = len(self._buffer) if limit is None else min(limit, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def at_end(self) -> bool:
+        return not self._buffer and not await self._fill()
+
+    async def skip(self, size: int):
+        while size:
+            data = await self.read_some(size)
+            if not data:
+                raise ValueError("Zip archive is truncated")
+            size -= len(data)
+
+    def unread(self, data: bytes):
+        self._buffer[:0] = data
+
+def _zip64_sizes(extra: bytes, size: int, compressed_size: int):
+    # Local headers only carry the 64-bit sizes, uncompressed first
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, offset)
+        if header_id == _ZIP64_EXTRA:
+            values = iter(struct.unpack_from(f"<{length // 8}Q", extra, offset + 4))
+            if size == 0xFFFFFFFF:
+                size = next(values)
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = next(values)
+            return size, compressed_size, True
+        offset += 4 + length
+    return size, compressed_size, False
+
+async def _inflate(reader: _Reader, compressed_size, max_size: int):
+    # Returns the inflated bytes, or None once they exceed max_size. With an unknown
+    # compressed size the deflate stream itself marks where the entry ends, so the
+    # reader is left inside the entry and the archive can't be read any further
+    decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+    output = bytearray()
+    remaining = compressed_size
+    while not decoder.eof:
+        if remaining == 0:
+            raise ValueError("Zip entry is corrupt")
+        data = await reader.read_some(remaining)
+        if not data:
+            raise ValueError("Zip archive is truncated")
+        if remaining is not None:
+            remaining -= len(data)
+
+        while data and not decoder.eof:
+            try:
+                inflated = decoder.decompress(data, _INFLATE_STEP)
+            except zlib.error:
+                raise ValueError("Zip entry is corrupt")
+            data = decoder.unconsumed_tail
+            output += inflated
+            if len(output) > max_size:
+                if remaining is not None:
+                    # The end is known, so the rest needn't be inflated at all
+                    await reader.skip(remaining)
+                return None
+
+    reader.unread(decoder.unused_data)
+    if remaining:
+        await reader.skip(remaining)
+    return bytes(output)
+
+async def iter_zip_entries(chunks, max_entry_size: int):
+    # Yields (name, data, error) for every file entry of a zip arriving as an async
+    # iterator of byte chunks; data is None when error says why the entry was skipped.
+    # Damage that makes the rest unreadable raises ValueError instead
+    reader = _Reader(chunks)
+    while True:
+        if await reader.at_end():
+            return
+        signature = await reader.read(4)
+        if signature in (CENTRAL_SIGNATURE, END_SIGNATURE):
+            # Everything after the last entry is the central directory
+            return
+        if signature != LOCAL_SIGNATURE:
+            raise ValueError("Not a zip archive, or a damaged one")
+
+        (_, _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length) = _LOCAL_HEADER.unpack(
+            signature + await reader.read(_LOCAL_HEADER.size - 4)
+        )
+        raw_name = await reader.read(name_length)
+        name = raw_name.decode("utf-8" if flags & FLAG_UTF8 else "cp437")
+        size, compressed_size, zip64 = _zip64_sizes(await reader.read(extra_length), size, compressed_size)
+
+        has_descriptor = flags & FLAG_DESCRIPTOR
+        known_size = None if has_descriptor else compressed_size
+        data, error = None, None
+        if flags & FLAG_ENCRYPTED or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            if has_descriptor:
+                raise ValueError(f"{name}: encrypted or unsupported entries need their sizes in the local header")
+            await reader.skip(compressed_size)
+            error = "Encrypted or unsupported compression method"
+        elif method == zipfile.ZIP_STORED:
+            if has_descriptor:
+                raise ValueError(f"{name}: stored entries need their sizes in the local header")
+            if compressed_size > max_entry_size:
+                await reader.skip(compressed_size)
+            else:
+                data = await reader.read(compressed_size)
+        else:
+            data = await _inflate(reader, known_size, max_entry_size)
+            if data is None and has_descriptor:
+                # Finding where it ends would mean inflating all of it, without bound
+                raise ValueError(f"{name}: larger than {max_entry_size} bytes")
+
+        if has_descriptor:
+            # Optional signature, then crc and both sizes, 64-bit for zip64 entries
+            head = await reader.read(4)
+            if head == DESCRIPTOR_SIGNATURE:
+                head = await reader.read(4)
+            crc, = struct.unpack("<I", head)
+            await reader.read(16 if zip64 else 8)
+
+        if error is None:
+            if data is None:
+                error = f"Larger than {max_entry_size} bytes"
+            elif zlib.crc32(data) != crc:
+                data, error = None, "Checksum mismatch"
+
+        if not name.endswith("/"):
+            yield name, data, error
+
+class _Sink:
+    # Write-only file object for zipfile; zipfile tracks offsets itself when it can't seek
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def stream_zip(entries):
+    # `entries` yields (name, modified datetime, async iterator of content chunks);
+    # produces the archive as it goes. Only the central directory, a few dozen bytes
+    # per entry, is kept until the end
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+    async for name, modified, chunks in entries:
+        info = zipfile.ZipInfo(name, date_time=modified.timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, "w") as target:
+            async for chunk in chunks:
+                target.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+        yield sink.drain()
+    archive.close()
+    yield sink.drain()